@@ -0,0 +1 @@
+"""أدوات قياس أداء البوت: توليد بيانات تجريبية وقياس زمن دوال Database."""
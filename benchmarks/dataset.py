@@ -0,0 +1,143 @@
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import time
+
+from database import Database
+
+SHORT_POINTS = 1
+LONG_POINTS = 10
+LONG_RATIO = 0.15
+CHUNK_SIZE = 50_000
+
+# توزيع الإرسال على ساعات اليوم (أغلب الشغل بالليل)
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 1, 2, 3, 4, 5, 5, 5, 6, 6, 6, 6, 7, 8, 9, 10, 10, 9, 6, 3]
+
+
+def _fmt(value: datetime.datetime) -> str:
+    # نفس الصيغة اللي SQLAlchemy بيخزن بيها DateTime في SQLite
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def generate(path: str, users: int = 10_000, videos: int = 5_000_000, days: int = 180, seed: int = 42,
+             end: datetime.datetime = None, verbose: bool = True) -> dict:
+    """ملف SQLite جديد فيه ``users`` مستخدم و``videos`` فيديو موزعين على آخر ``days`` يوم لحد ``end``
+    (النهارده ضمنهم، عشان استعلامات اليوم والأسبوع يبقى ليها بيانات).
+
+    - نشاط المستخدمين متفاوت (توزيع lognormal): قلة بتبعت كتير وأغلبهم قليل.
+    - عدد الفيديوهات في اليوم بيزيد تدريجياً مع الوقت، والإرسال متركز في ساعات الليل.
+    - الإدخال بـ executemany على sqlite3 مباشرة (من غير ORM ولا fsync) عشان ملايين الصفوف تاخد دقايق مش ساعات،
+      وبعدها النقاط/آخر نشاط والملخص اليومي بيتحسبوا بـ SQL من الفيديوهات.
+    """
+    rng = random.Random(seed)
+    end = end or datetime.datetime.now().replace(microsecond=0)
+    start = end - datetime.timedelta(days=days)
+    first_day = end.date() - datetime.timedelta(days=days - 1)
+    started_at = time.monotonic()
+
+    for stale in (path, path + '-wal', path + '-shm'):
+        if os.path.exists(stale):
+            os.remove(stale)
+    Database(path).engine.dispose() # إنشاء الجداول والفهارس بنفس تعريفات البوت
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+
+    user_ids = [1_000_000 + index for index in range(users)]
+    registrations = {}
+    rows = []
+    for user_id in user_ids:
+        # 70% مسجلين قبل بداية الفترة والباقي اتسجلوا خلالها
+        if rng.random() < 0.7:
+            registered = start - datetime.timedelta(days=rng.uniform(0, 365))
+        else:
+            registered = start + datetime.timedelta(seconds=rng.uniform(0, days * 86400))
+        registrations[user_id] = registered
+        rows.append((user_id, f"user{user_id}", rng.randint(14, 45), f"channel{user_id}", _fmt(registered), _fmt(registered), True))
+    conn.executemany(
+        "INSERT INTO users (user_id, name, age, channel_name, registration_date, last_activity, is_reachable, points) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, 0)", rows
+    )
+    conn.commit()
+
+    weights = [rng.lognormvariate(0, 1.2) for _ in user_ids]
+    cum_weights = []
+    total = 0.0
+    for weight in weights:
+        total += weight
+        cum_weights.append(total)
+
+    # عدد فيديوهات كل يوم: بيزيد خطياً من 0.5x لـ 1.5x من المتوسط
+    day_weights = [0.5 + index / max(days - 1, 1) for index in range(days)]
+    scale = videos / sum(day_weights)
+    per_day = [int(weight * scale) for weight in day_weights]
+    per_day[-1] += videos - sum(per_day)
+
+    pending = []
+    inserted = 0
+    for day_index, count in enumerate(per_day):
+        day_start = datetime.datetime.combine(first_day + datetime.timedelta(days=day_index), datetime.time.min)
+        hours = rng.choices(range(24), weights=HOUR_WEIGHTS, k=count)
+        senders = rng.choices(user_ids, cum_weights=cum_weights, k=count)
+        day_rows = []
+        for hour, user_id in zip(hours, senders):
+            sent_at = day_start + datetime.timedelta(hours=hour, seconds=rng.uniform(0, 3600))
+            if sent_at < registrations[user_id]:
+                sent_at = registrations[user_id] + datetime.timedelta(seconds=rng.uniform(0, 3600))
+            if sent_at >= end:
+                # النهارده لسه ماخلصش: الفيديو بيتسجل في الساعة اللي قبل end
+                sent_at = max(registrations[user_id], end - datetime.timedelta(seconds=rng.uniform(1, 3600)))
+            is_long = rng.random() < LONG_RATIO
+            day_rows.append((user_id, 'long' if is_long else 'short', LONG_POINTS if is_long else SHORT_POINTS, _fmt(sent_at)))
+        day_rows.sort(key=lambda row: row[3])
+        pending.extend(day_rows)
+        if len(pending) >= CHUNK_SIZE or day_index == days - 1:
+            conn.executemany("INSERT INTO videos (user_id, type, points_earned, sent_at) VALUES (?, ?, ?, ?)", pending)
+            conn.commit()
+            inserted += len(pending)
+            pending = []
+            if verbose:
+                print(f"  videos: {inserted:,}/{videos:,}", end="\r", flush=True)
+    if verbose:
+        print()
+
+    conn.execute(
+        "UPDATE users SET "
+        "points = COALESCE((SELECT SUM(points_earned) FROM videos WHERE videos.user_id = users.user_id), 0), "
+        "last_activity = COALESCE((SELECT MAX(sent_at) FROM videos WHERE videos.user_id = users.user_id), last_activity), "
+        "last_long_video_sent = (SELECT MAX(sent_at) FROM videos WHERE videos.user_id = users.user_id AND type = 'long')"
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+    database = Database(path)
+    daily_rows = database.rebuild_daily_stats()
+    database.engine.dispose()
+
+    info = {
+        'path': path, 'users': users, 'videos': videos, 'days': days, 'seed': seed,
+        'daily_stats_rows': daily_rows, 'size_mb': round(os.path.getsize(path) / 2**20, 1),
+        'generation_seconds': round(time.monotonic() - started_at, 1),
+    }
+    if verbose:
+        print(f"✅ dataset: {info}")
+    return info
+
+
+def main():
+    parser = argparse.ArgumentParser(description="توليد قاعدة بيانات تجريبية لقياس الأداء")
+    parser.add_argument("--db", default="bench_data.db", help="مسار الملف (بيتمسح لو موجود)")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--videos", type=int, default=5_000_000)
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    generate(args.db, users=args.users, videos=args.videos, days=args.days, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import argparse
+import datetime
+import fnmatch
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import sqlalchemy
+
+from benchmarks.dataset import generate
+from database import Database, SQLITE_PROFILES
+
+
+def _consume(iterator):
+    rows = 0
+    for batch in iterator:
+        rows += len(batch)
+    return rows
+
+
+def _peak_alloc_mb(func) -> float:
+    """أقصى ذاكرة Python اتحجزت أثناء تشغيل واحد للحالة (tracemalloc)، مستقل عن الحالات اللي قبلها."""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 2**20, 2)
+
+
+def remove_database(path: str):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def copy_dataset(source: str, target: str):
+    """نسخة جديدة من البيانات لحالات الكتابة، عشان الملف الأساسي يفضل زي ما اتولد بين التشغيلات."""
+    remove_database(target)
+    shutil.copyfile(source, target)
+
+
+def _percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def build_cases(db: Database, write_db: Database, user_ids, rng: random.Random):
+    """كل حالة: (الاسم، دالة بتاخد رقم التكرار، هل هي تقيلة). الدوال التقيلة بتتكرر مرات أقل.
+    الحالات اللي بتكتب (وتقرير الالتزام اللي بيقرا اللقطة اللي اتكتبت) بتشتغل على write_db، نسخة من البيانات."""
+    today = datetime.date.today()
+    month_start = today.replace(day=1)
+    pick = lambda: rng.choice(user_ids)
+    new_user_ids = itertools.count(max(user_ids) + 1)
+    # حالات FSM بتكتب وتقرا نفس مجموعة المستخدمين، فـ get_fsm_record بيلاقي الحالات اللي اتحفظت
+    fsm_users = user_ids[:200]
+    fsm_key = lambda user_id: f"1:{user_id}:{user_id}:::default"
+    fsm_batch = lambda: [
+        (fsm_key(user_id), 'UserStates:waiting_for_video', '{"video_type": "short"}', datetime.datetime.now())
+        for user_id in rng.sample(fsm_users, 20)
+    ]
+    broadcast_payload = json.dumps({'kind': 'text', 'text': 'benchmark'})
+    broadcast_job_id = write_db.create_broadcast_job(broadcast_payload, user_ids[0])
+
+    return [
+        ("get_user", lambda: db.get_user(pick()), False),
+        ("get_today_videos_count", lambda: db.get_today_videos_count(pick(), 'short'), False),
+        ("get_weekly_videos_count", lambda: db.get_weekly_videos_count(pick(), 'short'), False),
+        ("get_monthly_videos_count", lambda: db.get_monthly_videos_count(pick(), 'short'), False),
+        ("get_today_points", lambda: db.get_today_points(pick()), False),
+        ("get_stats_for_last_days", lambda: db.get_stats_for_last_days(pick(), 30), False),
+        ("get_caption_stats", lambda: db.get_caption_stats(pick()), False),
+        ("get_total_short_videos_sent_by_user", lambda: db.get_total_short_videos_sent_by_user(pick()), False),
+        ("get_total_long_videos_sent_by_user", lambda: db.get_total_long_videos_sent_by_user(pick()), False),
+        ("get_last_video_sent_details", lambda: db.get_last_video_sent_details(pick()), False),
+        ("get_user_videos_in_last_30_days", lambda: db.get_user_videos_in_last_30_days(pick()), False),
+        ("iter_user_videos_in_last_30_days", lambda: _consume(db.iter_user_videos_in_last_30_days(pick())), False),
+        ("get_videos_for_user_in_period", lambda: db.get_videos_for_user_in_period(pick(), month_start, today), False),
+        ("record_submission", lambda: write_db.record_submission(pick(), 'short', 1), False),
+        ("update_last_activity", lambda: write_db.update_last_activity(pick()), False),
+        ("add_user", lambda: write_db.add_user(next(new_user_ids), 'bench', 20, 'bench_channel'), False),
+        ("save_fsm_records", lambda: write_db.save_fsm_records(fsm_batch()), False),
+        ("get_fsm_record", lambda: write_db.get_fsm_record(fsm_key(rng.choice(fsm_users))), False),
+        ("enqueue_group_post", lambda: write_db.enqueue_group_post(
+            -100, 'video', 'caption', file_id='file', batch_key=f"short:{pick()}", batch_max=10), False),
+        ("get_due_group_posts", lambda: write_db.get_due_group_posts(20), False),
+        ("get_broadcast_recipients_batch", lambda: write_db.get_broadcast_recipients_batch(broadcast_job_id, pick(), user_ids[0], 500), False),
+        ("create_broadcast_job", lambda: write_db.create_broadcast_job(broadcast_payload, user_ids[0]), False),
+        ("get_total_videos_count", lambda: db.get_total_videos_count('short'), True),
+        ("get_top_active_users", lambda: db.get_top_active_users(5), True),
+        ("get_all_users", lambda: db.get_all_users(), True),
+        ("iter_users", lambda: _consume(db.iter_users()), True),
+        ("iter_users_report", lambda: _consume(db.iter_users_report()), True),
+        ("refresh_commitment_snapshot", lambda: write_db.refresh_commitment_snapshot('month', month_start, today.day * 3), True),
+        ("iter_commitment_report", lambda: _consume(write_db.iter_commitment_report('month')), True),
+        ("rebuild_daily_stats", lambda: write_db.rebuild_daily_stats(), True),
+        ("iter_videos", lambda: _consume(db.iter_videos()), True),
+        ("get_all_videos", lambda: db.get_all_videos(), True),
+    ]
+
+
+def run_case(func, repeat: int, warmup: int = 1):
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started_at) * 1000)
+    return {
+        'runs': repeat,
+        'p50_ms': round(_percentile(timings, 0.50), 3),
+        'p95_ms': round(_percentile(timings, 0.95), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'peak_alloc_mb': _peak_alloc_mb(func),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous: dict, current: dict):
+    print(f"{'benchmark':40} {'before p50':>12} {'after p50':>12} {'ratio':>8}")
+    for name, result in current['results'].items():
+        before = previous.get('results', {}).get(name)
+        if before is None:
+            continue
+        ratio = result['p50_ms'] / before['p50_ms'] if before['p50_ms'] else float('inf')
+        print(f"{name:40} {before['p50_ms']:>12.3f} {result['p50_ms']:>12.3f} {ratio:>7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس زمن دوال Database على بيانات تجريبية (p50/p95 وأقصى ذاكرة لكل حالة)")
+    parser.add_argument("--db", default="bench_data.db", help="ملف البيانات التجريبية (بيتولد لو مش موجود)")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--videos", type=int, default=5_000_000)
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--regenerate", action="store_true", help="إعادة توليد البيانات حتى لو الملف موجود")
+    parser.add_argument("--repeat", type=int, default=50, help="عدد التكرارات للدوال الخفيفة")
+    parser.add_argument("--heavy-repeat", type=int, default=3, help="عدد التكرارات للتقارير والدوال اللي بتقرا كل الجدول")
+    parser.add_argument("--only", action="append", help="تشغيل الحالات اللي اسمها مطابق للنمط بس (ممكن يتكرر)")
+    parser.add_argument("--skip", action="append", default=[], help="تخطي الحالات المطابقة للنمط (مثلاً get_all_videos)")
+    parser.add_argument("--sqlite-profile", choices=sorted(SQLITE_PROFILES), default="tuned", help="إعدادات SQLite (PRAGMAs) للاتصالات")
+    parser.add_argument("--output", help="حفظ النتايج JSON في الملف ده")
+    parser.add_argument("--compare", help="ملف نتايج قديم للمقارنة")
+    args = parser.parse_args()
+
+    dataset = None
+    if args.regenerate or not os.path.exists(args.db):
+        dataset = generate(args.db, users=args.users, videos=args.videos, days=args.days, seed=args.seed)
+
+    # حالات الكتابة بتشتغل على نسخة جديدة كل مرة، فحالات القراءة و --compare بيشوفوا نفس البيانات دايماً
+    write_path = args.db + '.write'
+    copy_dataset(args.db, write_path)
+
+    # الكاش مقفول عشان نقيس الاستعلامات نفسها
+    db = Database(args.db, user_cache_ttl=0, pragmas=SQLITE_PROFILES[args.sqlite_profile])
+    write_db = Database(write_path, user_cache_ttl=0, pragmas=SQLITE_PROFILES[args.sqlite_profile])
+    session = db.get_session()
+    user_ids = [row[0] for row in session.execute(sqlalchemy.text("SELECT user_id FROM users ORDER BY user_id"))]
+    video_count = session.execute(sqlalchemy.text("SELECT COUNT(*) FROM videos")).scalar()
+    session.close()
+
+    rng = random.Random(args.seed)
+    results = {}
+    for name, func, heavy in build_cases(db, write_db, user_ids, rng):
+        if args.only and not any(fnmatch.fnmatch(name, pattern) for pattern in args.only):
+            continue
+        if any(fnmatch.fnmatch(name, pattern) for pattern in args.skip):
+            continue
+        results[name] = run_case(func, args.heavy_repeat if heavy else args.repeat)
+        result = results[name]
+        print(f"{name:40} p50 {result['p50_ms']:>10.3f} ms   p95 {result['p95_ms']:>10.3f} ms   alloc {result['peak_alloc_mb']:>8.2f} MB")
+    write_db.engine.dispose()
+    remove_database(write_path)
+
+    report = {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlalchemy': sqlalchemy.__version__,
+            'platform': platform.platform(),
+            'db': args.db,
+            'sqlite_profile': args.sqlite_profile,
+            'users': len(user_ids),
+            'videos': video_count,
+            'generated': dataset,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"✅ النتايج اتحفظت في {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
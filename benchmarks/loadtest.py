@@ -0,0 +1,303 @@
+"""اختبار حمل كامل للبوت: سيرفر Bot API محلي + تحديثات تجريبية بتتبعت لـ Dispatcher بتاع main.py.
+
+الاستخدام:
+    python -m benchmarks.loadtest --users 50 --duration 30 --retry-after-rate 0.01 --output load.json
+
+كل مستخدم افتراضي بيسجل الأول وبعدين بيبعت خليط من فيديوهات قصيرة/طويلة وطلبات إحصائيات، والمشرف
+بيطلب التقارير. التحديثات بتتبعت بـ ``dp.feed_update`` (نفس اللي طابور الويب هوك بيعمله)، والنتيجة:
+عدد التحديثات في الثانية، p50/p95/p99 لزمن التحديث، وعدد طلبات كل method للـ Bot API (ومنها ردود 429).
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from aiohttp import web
+
+STUB_BOT_ID = 123456
+STUB_TOKEN = f"{STUB_BOT_ID}:LOADTEST"
+FIRST_VIRTUAL_USER_ID = 5_000_000
+
+
+def _percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))]
+
+
+class BotApiStub:
+    """سيرفر aiohttp بيقلد endpoints الـ Bot API اللي البوت بيستخدمها.
+
+    بيرد بنتايج صالحة لـ aiogram (Message / قائمة Messages / True) وبيعد الطلبات لكل method.
+    ``retry_after_rate``: نسبة الطلبات اللي بترجع 429 مع ``retry_after`` عشان نختبر الـ flood control.
+    """
+
+    def __init__(self, retry_after_rate: float = 0.0, retry_after: int = 1, latency: float = 0.0, seed: int = 0):
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        self.latency = latency
+        self.calls = Counter()
+        self.flood_responses = Counter()
+        self._rng = random.Random(seed)
+        self._message_ids = itertools.count(1)
+        self._runner = None
+        self.url = None
+
+    def _message(self, chat_id) -> dict:
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            chat_id = 0
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup" if chat_id < 0 else "private"},
+            "from": {"id": STUB_BOT_ID, "is_bot": True, "first_name": "stub"},
+        }
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        data = await request.post()
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.retry_after_rate and self._rng.random() < self.retry_after_rate:
+            self.flood_responses[method] += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            })
+
+        lowered = method.lower()
+        if lowered == "getme":
+            result = {"id": STUB_BOT_ID, "is_bot": True, "first_name": "stub", "username": "stub_bot"}
+        elif lowered == "sendmediagroup":
+            media = json.loads(data.get("media", "[]"))
+            result = [self._message(data.get("chat_id")) for _ in media]
+        elif lowered == "copymessage":
+            result = {"message_id": next(self._message_ids)}
+        elif lowered.startswith(("send", "forward", "edit")):
+            result = self._message(data.get("chat_id"))
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+class UpdateFactory:
+    def __init__(self):
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"load{user_id}"}
+
+    def message(self, user_id: int, text: str = None, video_duration: int = None) -> dict:
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+        }
+        if video_duration is not None:
+            file_id = f"video-{user_id}-{message['message_id']}"
+            message["video"] = {"file_id": file_id, "file_unique_id": file_id, "width": 720, "height": 1280, "duration": video_duration}
+        else:
+            message["text"] = text
+            if text.startswith("/"):
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+        return {"update_id": next(self._update_ids), "message": message}
+
+
+# السيناريوهات: (الاسم، الوزن، خطوات) — كل خطوة (text أو مدة فيديو)
+USER_SCENARIOS = [
+    ("short_video", 50, [("🎞️ فيديوهات 1 دقيقة", None), (None, 60)]),
+    ("short_video_burst", 15, [("🎞️ فيديوهات 1 دقيقة", None), (None, 45), (None, 50), (None, 55)]),
+    ("long_video", 5, [("🎬 تجميعة فيديو 10 دقايق", None), (None, 640)]),
+    ("stats_today", 15, [("📊 إحصائياتي", None), ("اليوم", None)]),
+    ("stats_30_days", 10, [("📊 إحصائياتي", None), ("آخر 30 يوم", None)]),
+    ("start", 5, [("/start", None)]),
+]
+ADMIN_SCENARIOS = [
+    ("admin_users_report", 2, [("⚙️ للمشرفين فقط", None), ("📈 بيانات وإحصائيات المستخدمين", None)]),
+    ("admin_daily_commitment", 3, [("⚙️ للمشرفين فقط", None), ("✅ ملتزم ولا غير ملتزم", None), ("☀️ الشغل اليومي", None)]),
+    ("admin_weekly_commitment", 2, [("⚙️ للمشرفين فقط", None), ("✅ ملتزم ولا غير ملتزم", None), ("🗓️ الشغل الاسبوعي", None)]),
+    ("admin_monthly_commitment", 1, [("⚙️ للمشرفين فقط", None), ("✅ ملتزم ولا غير ملتزم", None), ("⭐ الشغل الشهري", None)]),
+]
+REGISTRATION = [("/start", None), ("Load Tester", None), ("21", None), ("load-channel", None)]
+
+
+class LoadTest:
+    def __init__(self, dispatcher, bot, users: int, duration: float, admin_id: int, admin_interval: float, seed: int):
+        from aiogram.types import Update
+        self._update_type = Update
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.users = users
+        self.duration = duration
+        self.admin_id = admin_id
+        self.admin_interval = admin_interval
+        self.rng = random.Random(seed)
+        self.factory = UpdateFactory()
+        self.latencies = []
+        self.latencies_by_scenario = defaultdict(list)
+        self.errors = Counter()
+        self.updates = 0
+        self._deadline = 0.0
+
+    async def _feed(self, scenario: str, raw: dict):
+        update = self._update_type.model_validate(raw, context={"bot": self.bot})
+        started_at = time.perf_counter()
+        try:
+            await self.dispatcher.feed_update(self.bot, update)
+        except Exception as e:
+            self.errors[f"{scenario}:{type(e).__name__}"] += 1
+        elapsed = (time.perf_counter() - started_at) * 1000
+        self.updates += 1
+        self.latencies.append(elapsed)
+        self.latencies_by_scenario[scenario].append(elapsed)
+
+    async def _run_steps(self, user_id: int, scenario: str, steps):
+        for text, video_duration in steps:
+            await self._feed(scenario, self.factory.message(user_id, text=text, video_duration=video_duration))
+
+    async def _virtual_user(self, user_id: int):
+        await self._run_steps(user_id, "registration", REGISTRATION)
+        names, weights, steps = zip(*USER_SCENARIOS)
+        while time.monotonic() < self._deadline:
+            index = self.rng.choices(range(len(names)), weights=weights)[0]
+            await self._run_steps(user_id, names[index], steps[index])
+            await self._run_steps(user_id, names[index], [("الرجوع للقائمة الرئيسية", None)])
+
+    async def _admin(self):
+        names, weights, steps = zip(*ADMIN_SCENARIOS)
+        while time.monotonic() < self._deadline:
+            index = self.rng.choices(range(len(names)), weights=weights)[0]
+            await self._run_steps(self.admin_id, names[index], steps[index])
+            await asyncio.sleep(self.admin_interval)
+
+    async def run(self) -> dict:
+        self._deadline = time.monotonic() + self.duration
+        started_at = time.perf_counter()
+        tasks = [self._virtual_user(FIRST_VIRTUAL_USER_ID + index) for index in range(self.users)]
+        if self.admin_interval >= 0:
+            tasks.append(self._admin())
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started_at
+        return {
+            'updates': self.updates,
+            'elapsed_seconds': round(elapsed, 2),
+            'updates_per_second': round(self.updates / elapsed, 1) if elapsed else 0,
+            'latency_ms': self._summary(self.latencies),
+            'latency_by_scenario_ms': {name: self._summary(values) for name, values in sorted(self.latencies_by_scenario.items())},
+            'errors': dict(self.errors),
+        }
+
+    @staticmethod
+    def _summary(values) -> dict:
+        return {
+            'count': len(values),
+            'p50': round(_percentile(values, 0.50), 2),
+            'p95': round(_percentile(values, 0.95), 2),
+            'p99': round(_percentile(values, 0.99), 2),
+            'mean': round(statistics.fmean(values), 2) if values else 0.0,
+        }
+
+
+async def run_loadtest(args) -> dict:
+    stub = BotApiStub(retry_after_rate=args.retry_after_rate, retry_after=args.retry_after, latency=args.api_latency, seed=args.seed)
+    url = await stub.start()
+
+    # main.py بيقرا الإعدادات ويفتح قاعدة البيانات وقت الاستيراد، فلازم الـ env يتظبط الأول
+    import main
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    # aiogram بيسجل كل تحديث على INFO، فبنقلل اللوج عشان مايأثرش على القياس
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+
+    bot = main.build_bot(session=AiohttpSession(api=TelegramAPIServer.from_base(url)))
+    dispatcher = main.build_dispatcher(run_background=not args.no_background)
+    await dispatcher.emit_startup(bot=bot, dispatcher=dispatcher, **dispatcher.workflow_data)
+    try:
+        loadtest = LoadTest(dispatcher, bot, users=args.users, duration=args.duration, admin_id=main.ADMIN_ID,
+                            admin_interval=args.admin_interval, seed=args.seed)
+        result = await loadtest.run()
+        # فرصة للـ outbox يبعت اللي اتجمع قبل الإيقاف
+        await asyncio.sleep(args.drain)
+    finally:
+        await dispatcher.emit_shutdown(bot=bot, dispatcher=dispatcher, **dispatcher.workflow_data)
+        await bot.session.close()
+        await stub.stop()
+
+    result['bot_api_calls'] = dict(stub.calls)
+    result['bot_api_429'] = dict(stub.flood_responses)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="اختبار حمل للبوت مع سيرفر Bot API محلي")
+    parser.add_argument("--users", type=int, default=50, help="عدد المستخدمين الافتراضيين المتزامنين")
+    parser.add_argument("--duration", type=float, default=30, help="مدة الاختبار بالثواني")
+    parser.add_argument("--admin-interval", type=float, default=2.0, help="ثواني بين تقارير المشرف (-1 للإلغاء)")
+    parser.add_argument("--retry-after-rate", type=float, default=0.0, help="نسبة ردود 429 من سيرفر الـ Bot API")
+    parser.add_argument("--retry-after", type=int, default=1, help="قيمة retry_after في ردود 429")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="تأخير مصطنع لكل طلب Bot API بالثواني")
+    parser.add_argument("--db", help="ملف قاعدة البيانات (الافتراضي ملف مؤقت جديد)")
+    parser.add_argument("--dataset-users", type=int, default=0, help="ملء قاعدة البيانات مسبقاً بعدد مستخدمين (benchmarks.dataset)")
+    parser.add_argument("--dataset-videos", type=int, default=0, help="عدد الفيديوهات في البيانات المسبقة")
+    parser.add_argument("--no-background", action="store_true", help="عدم تشغيل الـ outbox ولقطات الالتزام")
+    parser.add_argument("--drain", type=float, default=1.0, help="ثواني انتظار بعد الاختبار قبل الإيقاف")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="حفظ النتيجة JSON")
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="loadtest-"), "bot_data.db")
+    if args.dataset_users:
+        from benchmarks.dataset import generate
+        generate(db_path, users=args.dataset_users, videos=args.dataset_videos, seed=args.seed)
+    os.environ["DB_NAME"] = db_path
+    os.environ["BOT_TOKEN"] = STUB_TOKEN
+
+    result = asyncio.run(run_loadtest(args))
+    result['meta'] = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'db': db_path,
+        'users': args.users,
+        'duration': args.duration,
+        'retry_after_rate': args.retry_after_rate,
+        'python': sys.version.split()[0],
+    }
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import argparse
+import datetime
+import json
+import os
+import random
+import statistics
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+
+from benchmarks.dataset import generate
+from benchmarks.db_bench import _percentile, _git_commit, copy_dataset, remove_database
+from database import Database, User, SQLITE_PROFILES
+
+
+def run_profile(path: str, profile: str, writers: int, readers: int, duration: float, seed: int) -> dict:
+    """``writers`` thread بيسجلوا فيديوهات (record_submission) و``readers`` thread بيقروا عدادات اليوم في نفس الوقت،
+    زي threads الـ AsyncDatabase وهي بتخدم مستخدمين كتير. بيرجع عدد الكتابات في الثانية وزمنها وعدد أخطاء القفل."""
+    db = Database(path, user_cache_ttl=0, pragmas=SQLITE_PROFILES[profile], pool_size=writers + readers)
+    session = db.get_session()
+    user_ids = [user.user_id for user in session.query(User).limit(5_000)]
+    session.close()
+
+    deadline = time.perf_counter() + duration
+    results = {'write': [], 'read': [], 'locked': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def worker(index: int, writer: bool):
+        rng = random.Random(seed + index)
+        timings = []
+        locked = errors = 0
+        while time.perf_counter() < deadline:
+            user_id = rng.choice(user_ids)
+            started_at = time.perf_counter()
+            try:
+                if writer:
+                    db.record_submission(user_id, 'short', 1)
+                else:
+                    db.get_today_videos_count(user_id, 'short')
+                    db.get_weekly_videos_count(user_id, 'short')
+            except OperationalError as e:
+                if 'locked' in str(e):
+                    locked += 1
+                else:
+                    errors += 1
+                continue
+            timings.append((time.perf_counter() - started_at) * 1000)
+        with lock:
+            results['write' if writer else 'read'].extend(timings)
+            results['locked'] += locked
+            results['errors'] += errors
+
+    threads = [threading.Thread(target=worker, args=(index, index < writers)) for index in range(writers + readers)]
+    started_at = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started_at
+    db.checkpoint_wal('TRUNCATE')
+    db.engine.dispose()
+
+    summary = {'profile': profile, 'pragmas': SQLITE_PROFILES[profile], 'elapsed_s': round(elapsed, 2),
+               'locked_errors': results['locked'], 'other_errors': results['errors']}
+    for kind in ('write', 'read'):
+        timings = results[kind]
+        summary[f'{kind}s'] = len(timings)
+        summary[f'{kind}s_per_second'] = round(len(timings) / elapsed, 1)
+        if timings:
+            summary[f'{kind}_p50_ms'] = round(_percentile(timings, 0.50), 3)
+            summary[f'{kind}_p99_ms'] = round(_percentile(timings, 0.99), 3)
+            summary[f'{kind}_mean_ms'] = round(statistics.fmean(timings), 3)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="مقارنة معدل الكتابة المتوازية بين بروفايلات SQLite (legacy و tuned)")
+    parser.add_argument("--db", default="bench_profile.db", help="ملف البيانات الأساسي (بيتولد لو مش موجود)")
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--videos", type=int, default=200_000)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--regenerate", action="store_true", help="إعادة توليد البيانات حتى لو الملف موجود")
+    parser.add_argument("--writers", type=int, default=4, help="عدد threads الكتابة (زي DB_EXECUTOR_WORKERS)")
+    parser.add_argument("--readers", type=int, default=4, help="عدد threads القراءة في نفس الوقت")
+    parser.add_argument("--duration", type=float, default=10, help="مدة كل بروفايل بالثواني")
+    parser.add_argument("--profile", action="append", choices=sorted(SQLITE_PROFILES), help="البروفايلات (الافتراضي كلهم)")
+    parser.add_argument("--output", help="حفظ النتايج JSON في الملف ده")
+    args = parser.parse_args()
+
+    if args.regenerate or not os.path.exists(args.db):
+        generate(args.db, users=args.users, videos=args.videos, days=args.days, seed=args.seed)
+
+    # كل بروفايل بيشتغل على نسخة جديدة من نفس البيانات
+    work_path = args.db + '.work'
+    results = []
+    for profile in args.profile or ['legacy', 'tuned']:
+        copy_dataset(args.db, work_path)
+        result = run_profile(work_path, profile, args.writers, args.readers, args.duration, args.seed)
+        results.append(result)
+        print(f"{profile:8} writes/s {result['writes_per_second']:>9.1f}   write p99 {result.get('write_p99_ms', 0):>9.2f} ms   "
+              f"reads/s {result['reads_per_second']:>9.1f}   read p99 {result.get('read_p99_ms', 0):>9.2f} ms   "
+              f"locked {result['locked_errors']}")
+    remove_database(work_path)
+
+    by_profile = {result['profile']: result for result in results}
+    if 'legacy' in by_profile and 'tuned' in by_profile and by_profile['legacy']['writes_per_second']:
+        gain = by_profile['tuned']['writes_per_second'] / by_profile['legacy']['writes_per_second']
+        print(f"write throughput: {gain:.2f}x")
+
+    if args.output:
+        report = {
+            'meta': {
+                'commit': _git_commit(),
+                'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                'writers': args.writers,
+                'readers': args.readers,
+                'duration_s': args.duration,
+            },
+            'results': results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"✅ النتايج اتحفظت في {args.output}")
+
+
+if __name__ == "__main__":
+    main()
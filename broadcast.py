@@ -0,0 +1,236 @@
+import asyncio
+import json
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+from aiogram.types import Message
+
+import messages as msg_texts
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+def payload_from_message(message: Message):
+    """تحويل رسالة المشرف لبيانات إرسال بسيطة (نوع، نص/ملف، كابشن) يمكن إعادة استخدامها لكل مستخدم."""
+    if message.text:
+        return {'kind': 'text', 'text': message.text}
+    if message.photo:
+        return {'kind': 'photo', 'file_id': message.photo[-1].file_id, 'caption': message.caption}
+    if message.video:
+        return {'kind': 'video', 'file_id': message.video.file_id, 'caption': message.caption}
+    if message.audio:
+        return {'kind': 'audio', 'file_id': message.audio.file_id, 'caption': message.caption}
+    if message.document:
+        return {'kind': 'document', 'file_id': message.document.file_id, 'caption': message.caption}
+    return None
+
+
+# أخطاء BadRequest اللي معناها إن المستخدم مش هيستقبل رسايل تاني (حساب محذوف أو محادثة مش موجودة)
+PERMANENT_BAD_REQUEST_MARKERS = ("chat not found", "user is deactivated", "peer_id_invalid", "bot can't initiate conversation")
+
+
+def classify_send_error(error: Exception) -> str:
+    """تصنيف فشل الإرسال: 'unreachable' لو دائم (حظر/حساب محذوف/محادثة مش موجودة)، و'failed' لو مؤقت."""
+    if isinstance(error, TelegramForbiddenError):
+        return 'unreachable'
+    if isinstance(error, TelegramBadRequest) and any(marker in error.message.lower() for marker in PERMANENT_BAD_REQUEST_MARKERS):
+        return 'unreachable'
+    return 'failed'
+
+
+async def send_payload(bot: Bot, chat_id: int, payload: dict):
+    kind = payload['kind']
+    if kind == 'text':
+        await bot.send_message(chat_id=chat_id, text=payload['text'], parse_mode='Markdown')
+    elif kind == 'photo':
+        await bot.send_photo(chat_id=chat_id, photo=payload['file_id'], caption=payload['caption'], parse_mode='Markdown')
+    elif kind == 'video':
+        await bot.send_video(chat_id=chat_id, video=payload['file_id'], caption=payload['caption'], parse_mode='Markdown')
+    elif kind == 'audio':
+        await bot.send_audio(chat_id=chat_id, audio=payload['file_id'], caption=payload['caption'], parse_mode='Markdown')
+    elif kind == 'document':
+        await bot.send_document(chat_id=chat_id, document=payload['file_id'], caption=payload['caption'], parse_mode='Markdown')
+
+
+class BroadcastEngine:
+    """إرسال الرسائل الجماعية في الخلفية.
+
+    كل رسالة جماعية بتتسجل كـ job في قاعدة البيانات، والمستلمين بيتسحبوا على دفعات بعد
+    آخر user_id خلص (keyset). عدد ثابت من العمال بيشتركوا في token bucket واحد مضبوط على
+    حد تليجرام العام (~30 رسالة/ثانية)، ولما تليجرام يرجع RetryAfter الـ bucket كله بيقف
+    المدة المطلوبة. المستخدمين اللي حظروا البوت بيتعلموا كغير متاحين وبيتخطوا في المرات الجاية.
+    حالة كل مستلم بتتسجل فوراً، فلو البوت اتقفل في النص ``resume_unfinished`` بيكمل من مكان
+    ما وقف من غير ما يكرر الإرسال لحد.
+    """
+
+    def __init__(self, db, rate: float = 25, concurrency: int = 10, progress_interval: float = 5.0,
+                 max_retries: int = 3, batch_size: int = 500):
+        self.db = db
+        self.bucket = TokenBucket(rate)
+        self.concurrency = concurrency
+        self.progress_interval = progress_interval
+        self.max_retries = max_retries
+        self.batch_size = batch_size
+        self._tasks = {}
+        self._deliveries = set()
+
+    async def create_and_start(self, bot: Bot, payload: dict, admin_chat_id: int, reply_markup=None):
+        """تسجيل رسالة جماعية جديدة وبدء إرسالها في الخلفية. بيرجع (رقم الـ job، عدد المستلمين)."""
+        job_id = await self.db.create_broadcast_job(json.dumps(payload, ensure_ascii=False), admin_chat_id)
+        job = await self.db.get_broadcast_job(job_id)
+        self.start(bot, job_id, reply_markup)
+        return job_id, job.total_count
+
+    def start(self, bot: Bot, job_id: int, reply_markup=None):
+        if job_id in self._tasks:
+            return self._tasks[job_id]
+        task = asyncio.create_task(self._run(bot, job_id, reply_markup))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda finished: self._on_done(job_id, finished))
+        return task
+
+    def _on_done(self, job_id: int, task: asyncio.Task):
+        self._tasks.pop(job_id, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Broadcast job %s task crashed", job_id, exc_info=task.exception())
+
+    async def resume_unfinished(self, bot: Bot, reply_markup=None):
+        """استكمال أي رسائل جماعية لم تكتمل (يتم استدعاؤها عند بدء تشغيل البوت)."""
+        job_ids = await self.db.get_unfinished_broadcast_job_ids()
+        for job_id in job_ids:
+            logger.info("Resuming broadcast job %s", job_id)
+            self.start(bot, job_id, reply_markup)
+        return job_ids
+
+    async def stop(self):
+        """إيقاف الرسائل الجماعية الشغالة (عند إيقاف البوت) قبل قفل قاعدة البيانات.
+
+        الإرسالات اللي بدأت بالفعل بتكمل وتتسجل، فـ ``resume_unfinished`` بعد الـ restart مابيبعتهاش تاني.
+        """
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.gather(*self._deliveries, return_exceptions=True)
+
+    async def _call_with_retry(self, make_request):
+        """تنفيذ طلب Bot API تحت الـ token bucket، ومع RetryAfter الـ bucket كله بيقف ويتعاد الطلب."""
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            try:
+                return await make_request()
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning("Broadcast flood limit hit, sleeping %s seconds", e.retry_after)
+                self.bucket.pause(e.retry_after)
+
+    async def _send_with_retry(self, bot: Bot, chat_id: int, payload: dict):
+        await self._call_with_retry(lambda: send_payload(bot, chat_id, payload))
+
+    async def _notify_admin(self, bot: Bot, chat_id: int, text: str, reply_markup=None):
+        """رسالة للمشرف (التقدم/النتيجة). فشلها بيتسجل في اللوج بس ومابيوقفش الإرسال الجماعي."""
+        try:
+            return await self._call_with_retry(lambda: bot.send_message(chat_id, text, reply_markup=reply_markup))
+        except Exception as e:
+            logger.warning("Could not send broadcast status to admin %s: %s", chat_id, e)
+            return None
+
+    async def _deliver(self, bot: Bot, job_id: int, chat_id: int, payload: dict):
+        try:
+            await self._send_with_retry(bot, chat_id, payload)
+        except Exception as e:
+            status = classify_send_error(e)
+            logger.warning("Failed to send broadcast %s to user %s (%s): %s", job_id, chat_id, status, e)
+            await self.db.record_broadcast_delivery(job_id, chat_id, status, str(e))
+        else:
+            await self.db.record_broadcast_delivery(job_id, chat_id, 'sent')
+
+    async def _report_progress(self, bot: Bot, job_id: int, admin_chat_id: int, status_message_id: int):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            job = await self.db.get_broadcast_job(job_id)
+            try:
+                await bot.edit_message_text(
+                    msg_texts.MSG_BROADCAST_PROGRESS.format(done=job.sent_count + job.failed_count, total=job.total_count),
+                    chat_id=admin_chat_id, message_id=status_message_id
+                )
+            except Exception as e:
+                logger.debug("Could not edit broadcast progress message: %s", e)
+
+    async def _run(self, bot: Bot, job_id: int, reply_markup=None):
+        try:
+            await self._run_job(bot, job_id, reply_markup)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # الـ job بيتعلم 'failed' وبيتكمل من مكان ما وقف مع الـ restart الجاي (resume_unfinished)
+            logger.exception("Broadcast job %s failed", job_id)
+            try:
+                await self.db.set_broadcast_job_status(job_id, 'failed')
+                job = await self.db.get_broadcast_job(job_id)
+                admin_chat_id = job.admin_chat_id
+            except Exception as db_error:
+                logger.error("Could not mark broadcast job %s as failed: %s", job_id, db_error)
+                return
+            await self._notify_admin(
+                bot, admin_chat_id, msg_texts.MSG_BROADCAST_JOB_CRASHED.format(job_id=job_id, error=type(e).__name__),
+                reply_markup=reply_markup
+            )
+
+    async def _run_job(self, bot: Bot, job_id: int, reply_markup=None):
+        job = await self.db.get_broadcast_job(job_id)
+        if job.status == 'failed':
+            await self.db.set_broadcast_job_status(job_id, 'running')
+        payload = json.loads(job.payload)
+        cursor = job.last_user_id
+        started_at = time.monotonic()
+
+        status = await self._notify_admin(
+            bot, job.admin_chat_id,
+            msg_texts.MSG_BROADCAST_PROGRESS.format(done=job.sent_count + job.failed_count, total=job.total_count)
+        )
+        progress_task = None
+        if status is not None:
+            progress_task = asyncio.create_task(self._report_progress(bot, job_id, job.admin_chat_id, status.message_id))
+        try:
+            while True:
+                batch = await self.db.get_broadcast_recipients_batch(job_id, cursor, job.admin_chat_id, self.batch_size)
+                if not batch:
+                    break
+                queue = asyncio.Queue()
+                for chat_id in batch:
+                    queue.put_nowait(chat_id)
+
+                async def worker():
+                    while not queue.empty():
+                        # shield: لو الـ task اتلغت (إيقاف البوت) الإرسال الجاري يكمل ويتسجل عشان مايتكررش عند الاستكمال،
+                        # و stop() بيستنى الإرسالات دي قبل قفل قاعدة البيانات
+                        delivery = asyncio.ensure_future(self._deliver(bot, job_id, queue.get_nowait(), payload))
+                        self._deliveries.add(delivery)
+                        delivery.add_done_callback(self._deliveries.discard)
+                        await asyncio.shield(delivery)
+
+                await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(batch)))))
+                cursor = batch[-1]
+                await self.db.advance_broadcast_cursor(job_id, cursor)
+        finally:
+            if progress_task is not None:
+                progress_task.cancel()
+
+        await self.db.finish_broadcast_job(job_id)
+        job = await self.db.get_broadcast_job(job_id)
+        logger.info("Broadcast %s finished: %s sent, %s failed in %.1fs", job_id, job.sent_count, job.failed_count, time.monotonic() - started_at)
+        if job.sent_count > 0:
+            await self._notify_admin(bot, job.admin_chat_id, msg_texts.MSG_BROADCAST_SUCCESS.format(count=job.sent_count), reply_markup)
+        if job.failed_count > 0:
+            await self._notify_admin(bot, job.admin_chat_id, msg_texts.MSG_BROADCAST_FAILED.format(failed_count=job.failed_count), reply_markup)
+        if job.pruned_count > 0 or job.unreachable_count > 0:
+            await self._notify_admin(
+                bot, job.admin_chat_id,
+                msg_texts.MSG_BROADCAST_PRUNED.format(pruned=job.pruned_count, newly_unreachable=job.unreachable_count),
+                reply_markup
+            )
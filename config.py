@@ -7,10 +7,61 @@ GROUP_ID = int(os.getenv("GROUP_ID", "-1002826113800"))  # استبدل بمعر
 ADMIN_ID = int(os.getenv("ADMIN_ID", "6660295630"))      # استبدل بمعرف التليجرام الخاص بالمشرف
 
 # مسار قاعدة البيانات
-DB_NAME = "bot_data.db"
+DB_NAME = os.getenv("DB_NAME", "bot_data.db")
+
+# عدد الـ threads المخصصة لتنفيذ استعلامات قاعدة البيانات بعيداً عن الـ event loop
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "4"))
+
+# إعدادات SQLite: "tuned" (WAL و synchronous=NORMAL) أو "legacy" (إعدادات SQLite الافتراضية)
+# مع تعديلات بروفايل tuned بأسماء الـ PRAGMA (مهلة انتظار القفل بالمللي ثانية، حجم mmap والكاش بالميجا)،
+# عدد اتصالات الـ pool (على الأقل عدد threads قاعدة البيانات)، وكل كام ثانية يتعمل checkpoint لملف الـ WAL
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "tuned")
+SQLITE_PRAGMA_OVERRIDES = {
+    'synchronous': os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    'busy_timeout': int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    'mmap_size': int(os.getenv("SQLITE_MMAP_SIZE_MB", "256")) * 2**20,
+    'cache_size': -int(os.getenv("SQLITE_CACHE_SIZE_MB", "64")) * 2**10, # بالسالب = كيلوبايت
+}
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", str(max(8, DB_EXECUTOR_WORKERS))))
+SQLITE_WAL_CHECKPOINT_SECONDS = float(os.getenv("SQLITE_WAL_CHECKPOINT_SECONDS", "300"))
+
+# كاش بيانات المستخدمين: أقصى عدد مستخدمين في الذاكرة ومدة صلاحية كل عنصر بالثواني
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
 
 # حد إرسال الفيديوهات الطويلة بالأيام (فيديو واحد كل 3 أيام)
 LONG_VIDEO_COOLDOWN_DAYS = 3
 
 # عدد الفيديوهات القصيرة المطلوبة يومياً (هذا يمكن أن يصبح إعداداً للمشرف مستقبلاً)
 REQUIRED_SHORT_VIDEOS_DAILY = 3
+
+# الرسائل الجماعية: أقصى عدد رسائل في الثانية (حد تليجرام ~30)، عدد الإرسالات المتوازية، وكل كام ثانية يتحدث تقدم الإرسال للمشرف
+BROADCAST_RATE_PER_SECOND = float(os.getenv("BROADCAST_RATE_PER_SECOND", "25"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))
+BROADCAST_PROGRESS_INTERVAL_SECONDS = float(os.getenv("BROADCAST_PROGRESS_INTERVAL_SECONDS", "5"))
+
+# تخزين حالات FSM في قاعدة البيانات: مدة صلاحية الحالة، مدة الاعتماد على الكاش، وكل قد إيه تتحفظ التعديلات
+FSM_STATE_TTL_SECONDS = float(os.getenv("FSM_STATE_TTL_SECONDS", str(24 * 60 * 60)))
+FSM_CACHE_TTL_SECONDS = float(os.getenv("FSM_CACHE_TTL_SECONDS", "5"))
+FSM_FLUSH_INTERVAL_SECONDS = float(os.getenv("FSM_FLUSH_INTERVAL_SECONDS", "0.5"))
+
+# منشورات جروب المراجعة: أقصى عدد رسائل في الدقيقة للجروب (حد تليجرام ~20) وعدد المحاولات قبل اعتبار المنشور فاشل
+GROUP_POSTS_PER_MINUTE = float(os.getenv("GROUP_POSTS_PER_MINUTE", "20"))
+GROUP_POST_MAX_ATTEMPTS = int(os.getenv("GROUP_POST_MAX_ATTEMPTS", "5"))
+
+# تجميع الفيديوهات القصيرة المتتالية من نفس المستخدم في منشور واحد (media group): مدة الانتظار بالثواني وأقصى عدد
+GROUP_MEDIA_BATCH_WINDOW_SECONDS = float(os.getenv("GROUP_MEDIA_BATCH_WINDOW_SECONDS", "10"))
+GROUP_MEDIA_BATCH_MAX = int(os.getenv("GROUP_MEDIA_BATCH_MAX", "10"))
+
+# صيغة ملفات تقارير المشرف: "csv" أو "xlsx" (xlsx محتاجة openpyxl، ولو مش موجودة بترجع csv)
+REPORT_EXPORT_FORMAT = os.getenv("REPORT_EXPORT_FORMAT", "csv")
+
+# كل كام دقيقة تتحسب لقطات الالتزام (اليوم/الأسبوع/الشهر) لتقارير المشرف، بالإضافة لبداية كل يوم
+COMMITMENT_SNAPSHOT_INTERVAL_MINUTES = float(os.getenv("COMMITMENT_SNAPSHOT_INTERVAL_MINUTES", "15"))
+
+# وضع البروفايلنج لاستعلامات SQL لكل تحديث: "off" أو "log" (تحذير في اللوج) أو "raise" (استثناء، للاختبارات)
+# الحد الافتراضي لعدد الاستعلامات لكل هاندلر، حدود خاصة بالشكل "handler=50,handler2=10"، وكام تكرار لنفس الاستعلام يعتبر N+1
+QUERY_BUDGET_MODE = os.getenv("QUERY_BUDGET_MODE", "off")
+QUERY_BUDGET_DEFAULT = int(os.getenv("QUERY_BUDGET_DEFAULT", "20"))
+QUERY_BUDGETS = os.getenv("QUERY_BUDGETS", "")
+QUERY_BUDGET_REPEAT_THRESHOLD = int(os.getenv("QUERY_BUDGET_REPEAT_THRESHOLD", "5"))
@@ -1,9 +1,17 @@
+import asyncio
+import contextvars
 import datetime
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, func, Boolean, desc
+import functools
+import inspect as pyinspect
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Date, func, Boolean, desc, Index, UniqueConstraint, case, and_, inspect, insert, select, delete, update, literal, text, event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.sql import extract
 
+from cache import TTLCache
+
 Base = declarative_base()
 
 class User(Base):
@@ -17,6 +25,8 @@ class User(Base):
     last_long_video_sent = Column(DateTime, nullable=True)
     last_activity = Column(DateTime, default=datetime.datetime.now) # لتتبع آخر نشاط للمستخدم
     registration_date = Column(DateTime, default=datetime.datetime.now)
+    is_reachable = Column(Boolean, nullable=False, default=True) # False لو حظر البوت أو حذف حسابه
+    unreachable_since = Column(DateTime, nullable=True)
 
     def __repr__(self):
         return f"<User(user_id={self.user_id}, name='{self.name}', age={self.age}, channel='{self.channel_name}', points={self.points})>"
@@ -29,18 +39,236 @@ class Video(Base):
     points_earned = Column(Integer, nullable=False)
     sent_at = Column(DateTime, default=datetime.datetime.now)
 
+    # فهارس لاستعلامات الفترات الزمنية: (مستخدم، نوع، تاريخ) للإحصائيات الشخصية و(تاريخ) للتقارير العامة
+    __table_args__ = (
+        Index('ix_videos_user_type_sent_at', 'user_id', 'type', 'sent_at'),
+        Index('ix_videos_sent_at', 'sent_at'),
+    )
+
     def __repr__(self):
         return f"<Video(user_id={self.user_id}, type='{self.type}', points={self.points_earned}, sent_at={self.sent_at})>"
 
+class UserDailyStats(Base):
+    """ملخص يومي لكل مستخدم بيتحدث مع كل فيديو، عشان الإحصائيات تقرأ صفوف قليلة بدل ما تعد كل الفيديوهات."""
+    __tablename__ = 'user_daily_stats'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    day = Column(Date, nullable=False)
+    short_count = Column(Integer, nullable=False, default=0)
+    long_count = Column(Integer, nullable=False, default=0)
+    points = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'day', name='uq_user_daily_stats_user_day'),
+    )
+
+    def __repr__(self):
+        return f"<UserDailyStats(user_id={self.user_id}, day={self.day}, short={self.short_count}, long={self.long_count}, points={self.points})>"
+
+class BroadcastJob(Base):
+    """رسالة جماعية محفوظة: بيانات الرسالة + مؤشر آخر مستخدم اتبعتله عشان نكمل بعد أي restart."""
+    __tablename__ = 'broadcast_jobs'
+    id = Column(Integer, primary_key=True)
+    payload = Column(Text, nullable=False) # JSON: نوع الرسالة ونصها/الملف والكابشن
+    admin_chat_id = Column(Integer, nullable=False)
+    status = Column(String, nullable=False, default='running') # 'running' or 'done' or 'failed' (بيتكمل مع الـ restart)
+    last_user_id = Column(Integer, nullable=False, default=0) # كل المستخدمين لحد الرقم ده خلصوا
+    total_count = Column(Integer, nullable=False, default=0)
+    sent_count = Column(Integer, nullable=False, default=0)
+    failed_count = Column(Integer, nullable=False, default=0)
+    pruned_count = Column(Integer, nullable=False, default=0) # مستخدمين اتخطوا لأنهم غير متاحين من قبل
+    unreachable_count = Column(Integer, nullable=False, default=0) # مستخدمين اكتشفنا في الإرسال ده إنهم غير متاحين
+    created_at = Column(DateTime, default=datetime.datetime.now)
+    finished_at = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<BroadcastJob(id={self.id}, status='{self.status}', sent={self.sent_count}, failed={self.failed_count}, total={self.total_count})>"
+
+class BroadcastDelivery(Base):
+    """حالة الإرسال لكل مستلم في رسالة جماعية (تمنع تكرار الإرسال عند الاستكمال)."""
+    __tablename__ = 'broadcast_deliveries'
+    id = Column(Integer, primary_key=True)
+    job_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    status = Column(String, nullable=False) # 'sent' or 'failed' or 'unreachable'
+    error = Column(String, nullable=True)
+    delivered_at = Column(DateTime, default=datetime.datetime.now)
+
+    __table_args__ = (
+        UniqueConstraint('job_id', 'user_id', name='uq_broadcast_deliveries_job_user'),
+    )
+
+class FsmRecord(Base):
+    """حالة وبيانات FSM لكل مستخدم/محادثة (بديل التخزين في الذاكرة عشان تعيش بعد الـ restart وتتشارك بين العمليات)."""
+    __tablename__ = 'fsm_states'
+    key = Column(String, primary_key=True)
+    state = Column(String, nullable=True)
+    data = Column(Text, nullable=False, default='{}') # JSON
+    updated_at = Column(DateTime, nullable=False, default=datetime.datetime.now, index=True)
+
+class GroupOutbox(Base):
+    """منشورات مستنية تتبعت لجروب المراجعة (outbox): الهاندلر بيسجلها ويرد فوراً والإرسال بيتم في الخلفية."""
+    __tablename__ = 'group_outbox'
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(Integer, nullable=False)
+    kind = Column(String, nullable=False) # 'video' or 'message'
+    file_id = Column(String, nullable=True)
+    text = Column(Text, nullable=False) # الكابشن أو نص الرسالة
+    batch_key = Column(String, nullable=True) # المنشورات المتتالية بنفس المفتاح بتتجمع في media group واحدة
+    status = Column(String, nullable=False, default='pending') # 'pending' or 'sent' or 'failed'
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.datetime.now)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.now)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_group_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self):
+        return f"<GroupOutbox(id={self.id}, kind='{self.kind}', status='{self.status}', attempts={self.attempts})>"
+
+class CommitmentSnapshot(Base):
+    """تجميعات الالتزام المحسوبة مسبقاً لكل مستخدم في الفترة الحالية (يوم/أسبوع/شهر) لحد لحظة computed_at."""
+    __tablename__ = 'commitment_snapshots'
+    id = Column(Integer, primary_key=True)
+    period = Column(String, nullable=False) # 'day' or 'week' or 'month'
+    user_id = Column(Integer, nullable=False)
+    short_count = Column(Integer, nullable=False, default=0)
+    long_count = Column(Integer, nullable=False, default=0)
+    points = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint('period', 'user_id', name='uq_commitment_snapshots_period_user'),
+    )
+
+class CommitmentSnapshotRun(Base):
+    """آخر حساب لكل فترة: بدايتها، المطلوب من الفيديوهات القصيرة، ووقت الحساب (اللي بعده بيتحسب كـ delta)."""
+    __tablename__ = 'commitment_snapshot_runs'
+    period = Column(String, primary_key=True)
+    period_start = Column(Date, nullable=False)
+    required_shorts = Column(Integer, nullable=False)
+    computed_at = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<CommitmentSnapshotRun(period='{self.period}', start={self.period_start}, required={self.required_shorts}, computed_at={self.computed_at})>"
+
+def _day_range(start_date: datetime.date, end_date: datetime.date):
+    """تحويل فترة أيام [start_date, end_date] إلى مدى زمني نصف مفتوح [start, end) يستفيد من فهرس sent_at."""
+    start = datetime.datetime.combine(start_date, datetime.time.min)
+    end = datetime.datetime.combine(end_date + datetime.timedelta(days=1), datetime.time.min)
+    return start, end
+
+def _in_batches(result):
+    """تحويل نتيجة استعلام (مع yield_per) لدفعات من tuples عادية."""
+    for partition in result.partitions():
+        yield [tuple(row) for row in partition]
+
+def _daily_stats_upsert(user_id: int, video_type: str, points: int, day: datetime.date):
+    """جملة INSERT ... ON CONFLICT لزيادة عدادات اليوم في user_daily_stats."""
+    short_inc = 1 if video_type == 'short' else 0
+    long_inc = 1 if video_type == 'long' else 0
+    stmt = sqlite_insert(UserDailyStats).values(
+        user_id=user_id, day=day, short_count=short_inc, long_count=long_inc, points=points
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=['user_id', 'day'],
+        set_={
+            'short_count': UserDailyStats.short_count + short_inc,
+            'long_count': UserDailyStats.long_count + long_inc,
+            'points': UserDailyStats.points + points,
+        }
+    )
+
+def _daily_count_column(video_type: str):
+    return UserDailyStats.short_count if video_type == 'short' else UserDailyStats.long_count
+
+# إعدادات SQLite اللي بتتطبق على كل اتصال جديد (PRAGMA):
+# - legacy: إعدادات SQLite الافتراضية (rollback journal و fsync كامل مع كل commit)؛ WAL بيفضل متسجل في الملف فبنرجعه صراحة
+# - tuned: WAL (القراءة ماتستناش الكتابة)، synchronous=NORMAL (fsync عند الـ checkpoint بس؛ آمن مع WAL
+#   وممكن يضيع آخر commit بس لو الجهاز نفسه وقع)، busy_timeout بدل "database is locked" الفوري،
+#   mmap وكاش صفحات أكبر للقراءة
+SQLITE_PROFILES = {
+    'legacy': {'journal_mode': 'DELETE'},
+    'tuned': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000, # بالمللي ثانية
+        'mmap_size': 256 * 2**20, # بالبايت
+        'cache_size': -64 * 2**10, # بالسالب = كيلوبايت
+        'temp_store': 'MEMORY',
+    },
+}
+
+def sqlite_profile(name: str = 'tuned', **overrides) -> dict:
+    """PRAGMAs بروفايل معين (للـ ``pragmas`` بتاع Database). التعديلات (قيمة None بتشيل الـ PRAGMA) بتتطبق
+    على tuned بس، و legacy بيفضل إعدادات SQLite الافتراضية زي ما هي."""
+    pragmas = dict(SQLITE_PROFILES[name])
+    if name != 'legacy':
+        pragmas.update(overrides)
+    return {key: value for key, value in pragmas.items() if value is not None}
+
 class Database:
-    def __init__(self, db_name='bot_data.db'):
-        self.engine = create_engine(f'sqlite:///{db_name}')
+    def __init__(self, db_name='bot_data.db', user_cache_size: int = 1024, user_cache_ttl: float = 60.0,
+                 pragmas: dict = None, pool_size: int = 8):
+        # pool ثابت من الاتصالات (بدل اتصال جديد لكل session) يكفي threads الـ AsyncDatabase
+        self.pragmas = SQLITE_PROFILES['tuned'] if pragmas is None else pragmas
+        busy_timeout = self.pragmas.get('busy_timeout', 5000)
+        self.engine = create_engine(
+            f'sqlite:///{db_name}',
+            pool_size=pool_size,
+            max_overflow=pool_size,
+            connect_args={'check_same_thread': False, 'timeout': busy_timeout / 1000}
+        )
+        event.listen(self.engine, "connect", self._apply_pragmas)
+        # كاش لبيانات المستخدمين (get_user) يتم إبطاله مع أي كتابة على المستخدم
+        self.user_cache = TTLCache(maxsize=user_cache_size, ttl=user_cache_ttl)
+        had_daily_stats = inspect(self.engine).has_table(UserDailyStats.__tablename__)
         Base.metadata.create_all(self.engine)
         self.Session = sessionmaker(bind=self.engine)
+        self._migrate(backfill_daily_stats=not had_daily_stats)
+
+    def _migrate(self, backfill_daily_stats: bool = False):
+        """ترقية ملفات قاعدة البيانات القديمة: create_all لا يضيف الأعمدة والفهارس الجديدة لجداول موجودة بالفعل."""
+        self._add_missing_columns()
+        for index in Video.__table__.indexes:
+            index.create(bind=self.engine, checkfirst=True)
+        if backfill_daily_stats:
+            # جدول الملخص اليومي اتعمل دلوقتي على قاعدة بيانات قديمة: نملاه من الفيديوهات الموجودة
+            self.rebuild_daily_stats()
+
+    def _add_missing_columns(self):
+        inspector = inspect(self.engine)
+        with self.engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                existing = {column['name'] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in existing:
+                        continue
+                    ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=self.engine.dialect)}"
+                    if column.default is not None and column.default.is_scalar:
+                        default = literal(column.default.arg).compile(dialect=self.engine.dialect, compile_kwargs={'literal_binds': True})
+                        ddl += f" DEFAULT {default}"
+                    conn.execute(text(ddl))
+
+    def _apply_pragmas(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in self.pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
 
     def get_session(self):
         return self.Session()
 
+    def checkpoint_wal(self, mode: str = 'PASSIVE'):
+        """نقل صفحات ملف الـ WAL لقاعدة البيانات. PASSIVE مابيستناش حد، TRUNCATE بيصفر الملف (وقت الإيقاف).
+        بيرجع (busy, wal_pages, checkpointed_pages)، أو None لو القاعدة مش WAL."""
+        if str(self.pragmas.get('journal_mode', '')).upper() != 'WAL':
+            return None
+        with self.engine.connect() as conn:
+            return tuple(conn.exec_driver_sql(f"PRAGMA wal_checkpoint({mode})").one())
+
     def add_user(self, user_id: int, name: str, age: int, channel_name: str):
         session = self.get_session()
         user = session.query(User).filter_by(user_id=user_id).first()
@@ -49,32 +277,50 @@ class Database:
             session.add(new_user)
             session.commit()
             session.close()
+            self.user_cache.invalidate(user_id)
             return True
         session.close()
         return False
 
     def get_user(self, user_id: int):
+        user = self.user_cache.get(user_id)
+        if user is not None:
+            return user
         session = self.get_session()
         user = session.query(User).filter_by(user_id=user_id).first()
         session.close()
+        if user is not None:
+            self.user_cache.set(user_id, user)
         return user
 
     def update_user_points(self, user_id: int, points: int):
         session = self.get_session()
-        user = session.query(User).filter_by(user_id=user_id).first()
-        if user:
-            user.points += points
-            session.commit()
+        # زيادة ذرية في SQL بدل القراءة ثم الكتابة (تمنع ضياع النقاط مع الطلبات المتزامنة)
+        session.execute(update(User).where(User.user_id == user_id).values(points=User.points + points))
+        session.commit()
         session.close()
+        self.user_cache.invalidate(user_id)
 
-    def record_video(self, user_id: int, video_type: str, points: int):
+    def record_submission(self, user_id: int, video_type: str, points: int, group_post: dict = None):
+        """تسجيل فيديو كامل في transaction واحد: إضافة الفيديو، الملخص اليومي، والنقاط وآخر نشاط للمستخدم.
+        group_post: منشور جروب المراجعة (بارامترات enqueue_group_post) بيتسجل في الـ outbox في نفس الـ transaction،
+        فمفيش فيديو بيتحسبله نقاط من غير ما يتبعت للجروب."""
         session = self.get_session()
-        new_video = Video(user_id=user_id, type=video_type, points_earned=points)
-        session.add(new_video)
+        sent_at = datetime.datetime.now()
+        user_values = {'points': User.points + points, 'last_activity': sent_at}
+        if video_type == 'long':
+            user_values['last_long_video_sent'] = sent_at
+        session.add(Video(user_id=user_id, type=video_type, points_earned=points, sent_at=sent_at))
+        session.execute(_daily_stats_upsert(user_id, video_type, points, sent_at.date()))
+        session.execute(update(User).where(User.user_id == user_id).values(**user_values))
+        if group_post is not None:
+            self._add_group_post(session, **group_post)
         session.commit()
         session.close()
-        self.update_user_points(user_id, points)
-        self.update_last_activity(user_id) # تحديث آخر نشاط
+        self.user_cache.invalidate(user_id)
+
+    def record_video(self, user_id: int, video_type: str, points: int):
+        self.record_submission(user_id, video_type, points)
 
     def update_last_activity(self, user_id: int):
         session = self.get_session()
@@ -83,41 +329,92 @@ class Database:
             user.last_activity = datetime.datetime.now()
             session.commit()
         session.close()
+        self.user_cache.invalidate(user_id)
 
-    def get_today_videos_count(self, user_id: int, video_type: str):
+    def _sum_daily_stats(self, user_id: int, column, start_day: datetime.date, end_day: datetime.date = None):
         session = self.get_session()
-        today = datetime.date.today()
-        count = session.query(Video).filter(
-            Video.user_id == user_id,
-            Video.type == video_type,
-            func.DATE(Video.sent_at) == today
-        ).count()
+        query = session.query(func.coalesce(func.sum(column), 0)).filter(
+            UserDailyStats.user_id == user_id,
+            UserDailyStats.day >= start_day
+        )
+        if end_day is not None:
+            query = query.filter(UserDailyStats.day <= end_day)
+        total = query.scalar()
         session.close()
-        return count
+        return total
+
+    def get_today_videos_count(self, user_id: int, video_type: str):
+        today = datetime.date.today()
+        return self._sum_daily_stats(user_id, _daily_count_column(video_type), today, today)
 
     def get_weekly_videos_count(self, user_id: int, video_type: str):
-        session = self.get_session()
         # بداية الأسبوع (الإثنين)
         start_of_week = datetime.date.today() - datetime.timedelta(days=datetime.date.today().weekday())
-        count = session.query(Video).filter(
-            Video.user_id == user_id,
-            Video.type == video_type,
-            Video.sent_at >= start_of_week.strftime('%Y-%m-%d 00:00:00') # التأكد من التوقيت
-        ).count()
-        session.close()
-        return count
+        return self._sum_daily_stats(user_id, _daily_count_column(video_type), start_of_week)
 
     def get_monthly_videos_count(self, user_id: int, video_type: str):
+        start_of_month = datetime.date.today().replace(day=1)
+        return self._sum_daily_stats(user_id, _daily_count_column(video_type), start_of_month)
+
+    def get_today_points(self, user_id: int):
+        today = datetime.date.today()
+        return self._sum_daily_stats(user_id, UserDailyStats.points, today, today)
+
+    def get_stats_for_last_days(self, user_id: int, days: int = 30):
+        """إجمالي (قصير، طويل، نقاط) لآخر عدد من الأيام من الملخص اليومي (بحد أقصى days + 1 صف)."""
+        session = self.get_session()
+        start_day = datetime.date.today() - datetime.timedelta(days=days)
+        short_total, long_total, points_total = session.query(
+            func.coalesce(func.sum(UserDailyStats.short_count), 0),
+            func.coalesce(func.sum(UserDailyStats.long_count), 0),
+            func.coalesce(func.sum(UserDailyStats.points), 0)
+        ).filter(
+            UserDailyStats.user_id == user_id,
+            UserDailyStats.day >= start_day
+        ).one()
+        session.close()
+        return short_total, long_total, points_total
+
+    def get_caption_stats(self, user_id: int):
+        """بيانات كابشن المجموعة في استعلام واحد: المستخدم + فيديوهات اليوم والأسبوع (قصير وطويل)."""
         session = self.get_session()
         today = datetime.date.today()
-        start_of_month = today.replace(day=1)
-        count = session.query(Video).filter(
-            Video.user_id == user_id,
-            Video.type == video_type,
-            Video.sent_at >= start_of_month.strftime('%Y-%m-%d 00:00:00')
-        ).count()
+        start_of_week = today - datetime.timedelta(days=today.weekday())
+        is_today = UserDailyStats.day == today
+        row = session.query(
+            User,
+            func.coalesce(func.sum(case((is_today, UserDailyStats.short_count), else_=0)), 0),
+            func.coalesce(func.sum(UserDailyStats.short_count), 0),
+            func.coalesce(func.sum(case((is_today, UserDailyStats.long_count), else_=0)), 0),
+            func.coalesce(func.sum(UserDailyStats.long_count), 0)
+        ).outerjoin(
+            UserDailyStats,
+            and_(UserDailyStats.user_id == User.user_id, UserDailyStats.day >= start_of_week)
+        ).filter(User.user_id == user_id).group_by(User.id).first()
         session.close()
-        return count
+        return tuple(row) if row else None
+
+    def rebuild_daily_stats(self):
+        """إعادة بناء جدول الملخص اليومي بالكامل من جدول الفيديوهات (للبيانات القديمة أو بعد أي تعديل يدوي)."""
+        session = self.get_session()
+        session.execute(delete(UserDailyStats))
+        day = func.date(Video.sent_at)
+        session.execute(
+            insert(UserDailyStats).from_select(
+                ['user_id', 'day', 'short_count', 'long_count', 'points'],
+                select(
+                    Video.user_id,
+                    day,
+                    func.sum(case((Video.type == 'short', 1), else_=0)),
+                    func.sum(case((Video.type == 'long', 1), else_=0)),
+                    func.sum(Video.points_earned)
+                ).group_by(Video.user_id, day)
+            )
+        )
+        session.commit()
+        rows = session.query(func.count(UserDailyStats.id)).scalar()
+        session.close()
+        return rows
 
     def get_user_videos_in_last_30_days(self, user_id: int):
         session = self.get_session()
@@ -142,6 +439,7 @@ class Database:
             user.last_long_video_sent = datetime.datetime.now()
             session.commit()
         session.close()
+        self.user_cache.invalidate(user_id)
 
     def get_total_videos_count(self, video_type: str = None):
         session = self.get_session()
@@ -164,6 +462,42 @@ class Database:
         session.close()
         return videos
 
+    def iter_users(self, batch_size: int = 1000):
+        """كل المستخدمين كـ tuples خفيفة على دفعات ثابتة الحجم بدل تحميل كل الكائنات في الذاكرة:
+        (user_id, name, age, channel_name, points, registration_date, is_reachable)."""
+        session = self.get_session()
+        try:
+            stmt = select(
+                User.user_id, User.name, User.age, User.channel_name, User.points, User.registration_date, User.is_reachable
+            ).order_by(User.id).execution_options(yield_per=batch_size)
+            yield from _in_batches(session.execute(stmt))
+        finally:
+            session.close()
+
+    def iter_videos(self, batch_size: int = 1000):
+        """كل الفيديوهات من الأحدث للأقدم كـ tuples على دفعات: (id, user_id, type, points_earned, sent_at)."""
+        session = self.get_session()
+        try:
+            stmt = select(
+                Video.id, Video.user_id, Video.type, Video.points_earned, Video.sent_at
+            ).order_by(Video.sent_at.desc()).execution_options(yield_per=batch_size)
+            yield from _in_batches(session.execute(stmt))
+        finally:
+            session.close()
+
+    def iter_user_videos_in_last_30_days(self, user_id: int, batch_size: int = 1000):
+        """فيديوهات المستخدم في آخر 30 يوم كـ tuples على دفعات: (id, type, points_earned, sent_at)."""
+        session = self.get_session()
+        try:
+            thirty_days_ago = datetime.datetime.now() - datetime.timedelta(days=30)
+            stmt = select(Video.id, Video.type, Video.points_earned, Video.sent_at).where(
+                Video.user_id == user_id,
+                Video.sent_at >= thirty_days_ago
+            ).execution_options(yield_per=batch_size)
+            yield from _in_batches(session.execute(stmt))
+        finally:
+            session.close()
+
     def get_total_short_videos_sent_by_user(self, user_id: int):
         session = self.get_session()
         count = session.query(Video).filter_by(user_id=user_id, type='short').count()
@@ -182,59 +516,352 @@ class Database:
         session.close()
         return last_video
 
+    def _users_report_query(self, session, *user_columns):
+        # window functions: الإجماليات لكل مستخدم + ترتيب فيديوهاته من الأحدث، وناخد الصف الأول بس
+        per_user_videos = session.query(
+            Video.user_id.label('user_id'),
+            Video.type.label('last_video_type'),
+            Video.sent_at.label('last_video_sent_at'),
+            func.sum(case((Video.type == 'short', 1), else_=0)).over(partition_by=Video.user_id).label('total_short'),
+            func.sum(case((Video.type == 'long', 1), else_=0)).over(partition_by=Video.user_id).label('total_long'),
+            func.row_number().over(partition_by=Video.user_id, order_by=(Video.sent_at.desc(), Video.id.desc())).label('rn')
+        ).subquery()
+
+        return session.query(
+            *user_columns,
+            func.coalesce(per_user_videos.c.total_short, 0),
+            func.coalesce(per_user_videos.c.total_long, 0),
+            per_user_videos.c.last_video_type,
+            per_user_videos.c.last_video_sent_at
+        ).outerjoin(
+            per_user_videos,
+            and_(per_user_videos.c.user_id == User.user_id, per_user_videos.c.rn == 1)
+        ).order_by(User.points.desc(), User.id)
+
+    def iter_users_report(self, batch_size: int = 1000):
+        """بيانات تقرير المشرف لكل المستخدمين (إجمالي القصير/الطويل وآخر فيديو) كـ tuples على دفعات:
+        (user_id, name, age, channel_name, points, registration_date, total_short, total_long, last_video_type, last_video_sent_at)."""
+        session = self.get_session()
+        try:
+            query = self._users_report_query(
+                session, User.user_id, User.name, User.age, User.channel_name, User.points, User.registration_date
+            )
+            yield from _in_batches(session.execute(query.statement.execution_options(yield_per=batch_size)))
+        finally:
+            session.close()
+
     def get_videos_for_user_in_period(self, user_id: int, start_date: datetime.date, end_date: datetime.date):
         session = self.get_session()
+        start, end = _day_range(start_date, end_date)
         videos = session.query(Video).filter(
             Video.user_id == user_id,
-            func.DATE(Video.sent_at) >= start_date,
-            func.DATE(Video.sent_at) <= end_date
+            Video.sent_at >= start,
+            Video.sent_at < end
         ).all()
         session.close()
         return videos
 
-    def get_users_by_activity_in_period(self, start_date: datetime.date, end_date: datetime.date):
-        session = self.get_session()
-        # جلب جميع المستخدمين
-        all_users = session.query(User).all()
-        
-        users_data = []
-        for user in all_users:
-            short_videos_count = session.query(Video).filter(
-                Video.user_id == user.user_id,
-                Video.type == 'short',
-                func.DATE(Video.sent_at) >= start_date,
-                func.DATE(Video.sent_at) <= end_date
-            ).count()
-            
-            long_videos_count = session.query(Video).filter(
-                Video.user_id == user.user_id,
-                Video.type == 'long',
-                func.DATE(Video.sent_at) >= start_date,
-                func.DATE(Video.sent_at) <= end_date
-            ).count()
-
-            points_earned = session.query(func.sum(Video.points_earned)).filter(
-                Video.user_id == user.user_id,
-                func.DATE(Video.sent_at) >= start_date,
-                func.DATE(Video.sent_at) <= end_date
-            ).scalar() or 0
-            
-            # تاريخ تسجيل المستخدم
-            registration_date_str = user.registration_date.strftime('%Y-%m-%d %H:%M')
-
-            # التحقق مما إذا كان المستخدم قد أرسل أي فيديوهات خلال الفترة
-            has_activity_in_period = (short_videos_count > 0 or long_videos_count > 0)
-
-            users_data.append({
-                'user': user,
-                'short_videos_count': short_videos_count,
-                'long_videos_count': long_videos_count,
-                'points_earned': points_earned,
-                'registration_date_str': registration_date_str,
-                'has_activity_in_period': has_activity_in_period
-            })
-        
-        # الترتيب حسب النقاط المكتسبة في هذه الفترة تنازلياً
-        users_data.sort(key=lambda x: x['points_earned'], reverse=True)
-        session.close()
-        return users_data
+    # --- لقطات الالتزام المحسوبة مسبقاً ---
+    def refresh_commitment_snapshot(self, period: str, period_start: datetime.date, required_shorts: int, as_of: datetime.datetime = None):
+        """إعادة حساب لقطة فترة كاملة في transaction واحد: تجميعات الفيديوهات من بداية الفترة لحد as_of."""
+        as_of = as_of or datetime.datetime.now()
+        start, _ = _day_range(period_start, period_start)
+        session = self.get_session()
+        session.execute(delete(CommitmentSnapshot).where(CommitmentSnapshot.period == period))
+        session.execute(
+            insert(CommitmentSnapshot).from_select(
+                ['period', 'user_id', 'short_count', 'long_count', 'points'],
+                select(
+                    literal(period),
+                    Video.user_id,
+                    func.sum(case((Video.type == 'short', 1), else_=0)),
+                    func.sum(case((Video.type == 'long', 1), else_=0)),
+                    func.sum(Video.points_earned)
+                ).where(Video.sent_at >= start, Video.sent_at < as_of).group_by(Video.user_id)
+            )
+        )
+        stmt = sqlite_insert(CommitmentSnapshotRun).values(
+            period=period, period_start=period_start, required_shorts=required_shorts, computed_at=as_of
+        )
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=['period'],
+            set_={'period_start': stmt.excluded.period_start, 'required_shorts': stmt.excluded.required_shorts, 'computed_at': stmt.excluded.computed_at}
+        ))
+        session.commit()
+        session.close()
+
+    def get_commitment_snapshot_run(self, period: str):
+        session = self.get_session()
+        run = session.query(CommitmentSnapshotRun).filter_by(period=period).first()
+        session.close()
+        return run
+
+    def iter_commitment_report(self, period: str, batch_size: int = 1000):
+        """تقرير الالتزام من آخر لقطة + delta صغير للفيديوهات اللي اتبعتت بعد computed_at بتاعها، كـ tuples على دفعات:
+        (user_id, name, age, channel_name, registration_date, short_count, long_count, points_earned).
+        computed_at بيتقرا في نفس الاستعلام مع صفوف اللقطة، فلو اللقطة اتحدثت في النص الفيديو مابيتحسبش مرتين."""
+        session = self.get_session()
+        try:
+            snapshot = session.query(CommitmentSnapshot).filter(CommitmentSnapshot.period == period).subquery()
+            as_of = session.query(CommitmentSnapshotRun.computed_at).filter(CommitmentSnapshotRun.period == period).scalar_subquery()
+            delta = session.query(
+                Video.user_id.label('user_id'),
+                func.sum(case((Video.type == 'short', 1), else_=0)).label('short_count'),
+                func.sum(case((Video.type == 'long', 1), else_=0)).label('long_count'),
+                func.sum(Video.points_earned).label('points')
+            ).filter(Video.sent_at >= as_of).group_by(Video.user_id).subquery()
+
+            short_count = func.coalesce(snapshot.c.short_count, 0) + func.coalesce(delta.c.short_count, 0)
+            long_count = func.coalesce(snapshot.c.long_count, 0) + func.coalesce(delta.c.long_count, 0)
+            points_earned = func.coalesce(snapshot.c.points, 0) + func.coalesce(delta.c.points, 0)
+            query = session.query(
+                User.user_id, User.name, User.age, User.channel_name, User.registration_date,
+                short_count, long_count, points_earned
+            ).outerjoin(snapshot, snapshot.c.user_id == User.user_id).outerjoin(
+                delta, delta.c.user_id == User.user_id
+            ).order_by(points_earned.desc(), User.id)
+            yield from _in_batches(session.execute(query.statement.execution_options(yield_per=batch_size)))
+        finally:
+            session.close()
+
+    # --- الرسائل الجماعية ---
+    def create_broadcast_job(self, payload: str, admin_chat_id: int):
+        session = self.get_session()
+        total_count = session.query(func.count(User.id)).filter(User.user_id != admin_chat_id, User.is_reachable == True).scalar()
+        pruned_count = session.query(func.count(User.id)).filter(User.user_id != admin_chat_id, User.is_reachable == False).scalar()
+        job = BroadcastJob(payload=payload, admin_chat_id=admin_chat_id, total_count=total_count, pruned_count=pruned_count)
+        session.add(job)
+        session.commit()
+        job_id = job.id
+        session.close()
+        return job_id
+
+    def get_broadcast_job(self, job_id: int):
+        session = self.get_session()
+        job = session.query(BroadcastJob).filter_by(id=job_id).first()
+        session.close()
+        return job
+
+    def get_unfinished_broadcast_job_ids(self):
+        session = self.get_session()
+        job_ids = [job_id for (job_id,) in session.query(BroadcastJob.id).filter(BroadcastJob.status != 'done').order_by(BroadcastJob.id)]
+        session.close()
+        return job_ids
+
+    def get_recent_broadcast_jobs(self, limit: int = 5):
+        session = self.get_session()
+        jobs = session.query(BroadcastJob).order_by(BroadcastJob.id.desc()).limit(limit).all()
+        session.close()
+        return jobs
+
+    def get_broadcast_recipients_batch(self, job_id: int, after_user_id: int, exclude_user_id: int, limit: int = 500):
+        """الدفعة التالية من المستلمين المتاحين بعد المؤشر (keyset على user_id) مع استبعاد اللي اتسجل لهم إرسال بالفعل."""
+        session = self.get_session()
+        already_delivered = select(BroadcastDelivery.user_id).where(BroadcastDelivery.job_id == job_id)
+        user_ids = [user_id for (user_id,) in session.query(User.user_id).filter(
+            User.user_id > after_user_id,
+            User.user_id != exclude_user_id,
+            User.is_reachable == True,
+            User.user_id.not_in(already_delivered)
+        ).order_by(User.user_id).limit(limit)]
+        session.close()
+        return user_ids
+
+    def record_broadcast_delivery(self, job_id: int, user_id: int, status: str, error: str = None):
+        session = self.get_session()
+        result = session.execute(
+            sqlite_insert(BroadcastDelivery).values(
+                job_id=job_id, user_id=user_id, status=status, error=error, delivered_at=datetime.datetime.now()
+            ).on_conflict_do_nothing(index_elements=['job_id', 'user_id'])
+        )
+        if result.rowcount:
+            if status == 'sent':
+                counters = {BroadcastJob.sent_count: BroadcastJob.sent_count + 1}
+            else:
+                counters = {BroadcastJob.failed_count: BroadcastJob.failed_count + 1}
+                if status == 'unreachable':
+                    counters[BroadcastJob.unreachable_count] = BroadcastJob.unreachable_count + 1
+            session.execute(update(BroadcastJob).where(BroadcastJob.id == job_id).values(counters))
+        if status == 'unreachable':
+            # المستخدم حظر البوت أو حذف حسابه: نستبعده من أي إرسال جاي
+            session.execute(update(User).where(User.user_id == user_id).values(is_reachable=False, unreachable_since=datetime.datetime.now()))
+        session.commit()
+        session.close()
+        if status == 'unreachable':
+            self.user_cache.invalidate(user_id)
+
+    def mark_user_reachable(self, user_id: int):
+        session = self.get_session()
+        session.execute(update(User).where(User.user_id == user_id).values(is_reachable=True, unreachable_since=None))
+        session.commit()
+        session.close()
+        self.user_cache.invalidate(user_id)
+
+    def advance_broadcast_cursor(self, job_id: int, last_user_id: int):
+        session = self.get_session()
+        session.execute(update(BroadcastJob).where(BroadcastJob.id == job_id).values(last_user_id=last_user_id))
+        session.commit()
+        session.close()
+
+    def finish_broadcast_job(self, job_id: int):
+        session = self.get_session()
+        session.execute(update(BroadcastJob).where(BroadcastJob.id == job_id).values(status='done', finished_at=datetime.datetime.now()))
+        session.commit()
+        session.close()
+
+    def set_broadcast_job_status(self, job_id: int, status: str):
+        session = self.get_session()
+        session.execute(update(BroadcastJob).where(BroadcastJob.id == job_id).values(status=status))
+        session.commit()
+        session.close()
+
+    # --- تخزين حالات FSM ---
+    def get_fsm_record(self, key: str):
+        """بيرجع (state, data_json, updated_at) أو None."""
+        session = self.get_session()
+        row = session.query(FsmRecord.state, FsmRecord.data, FsmRecord.updated_at).filter(FsmRecord.key == key).first()
+        session.close()
+        return tuple(row) if row else None
+
+    def save_fsm_records(self, records):
+        """حفظ مجموعة حالات مرة واحدة: records = [(key, state, data_json, updated_at), ...]. الحالة الفاضية بتتمسح."""
+        session = self.get_session()
+        for key, state, data, updated_at in records:
+            if state is None and data == '{}':
+                session.execute(delete(FsmRecord).where(FsmRecord.key == key))
+                continue
+            stmt = sqlite_insert(FsmRecord).values(key=key, state=state, data=data, updated_at=updated_at)
+            session.execute(stmt.on_conflict_do_update(
+                index_elements=['key'],
+                set_={'state': stmt.excluded.state, 'data': stmt.excluded.data, 'updated_at': stmt.excluded.updated_at}
+            ))
+        session.commit()
+        session.close()
+
+    def purge_expired_fsm_records(self, older_than: datetime.datetime):
+        session = self.get_session()
+        deleted = session.execute(delete(FsmRecord).where(FsmRecord.updated_at < older_than)).rowcount
+        session.commit()
+        session.close()
+        return deleted
+
+    # --- outbox منشورات الجروب ---
+    def enqueue_group_post(self, chat_id: int, kind: str, text: str, file_id: str = None,
+                           batch_key: str = None, batch_window: float = 0, batch_max: int = 10):
+        """إضافة منشور للـ outbox. المنشورات اللي ليها batch_key بتستنى batch_window ثانية عشان تتجمع مع
+        اللي بعدها، إلا لو عددها وصل batch_max فبتبقى مستحقة فوراً."""
+        session = self.get_session()
+        post_id = self._add_group_post(session, chat_id, kind, text, file_id, batch_key, batch_window, batch_max)
+        session.commit()
+        session.close()
+        return post_id
+
+    def _add_group_post(self, session, chat_id: int, kind: str, text: str, file_id: str = None,
+                        batch_key: str = None, batch_window: float = 0, batch_max: int = 10):
+        now = datetime.datetime.now()
+        post = GroupOutbox(
+            chat_id=chat_id, kind=kind, text=text, file_id=file_id, batch_key=batch_key,
+            next_attempt_at=now + datetime.timedelta(seconds=batch_window) if batch_key else now
+        )
+        session.add(post)
+        session.flush()
+        post_id = post.id
+        if batch_key:
+            # لو الدفعة اكتملت، أقدم batch_max منشور يبقوا مستحقين فوراً من غير ما يستنوا باقي المهلة
+            oldest_ids = [post_id for (post_id,) in session.query(GroupOutbox.id).filter(
+                GroupOutbox.batch_key == batch_key,
+                GroupOutbox.status == 'pending'
+            ).order_by(GroupOutbox.id).limit(batch_max)]
+            if len(oldest_ids) >= batch_max:
+                session.execute(update(GroupOutbox).where(GroupOutbox.id.in_(oldest_ids)).values(next_attempt_at=now))
+        return post_id
+
+    def get_due_group_posts(self, limit: int = 20):
+        session = self.get_session()
+        posts = session.query(GroupOutbox).filter(
+            GroupOutbox.status == 'pending',
+            GroupOutbox.next_attempt_at <= datetime.datetime.now()
+        ).order_by(GroupOutbox.id).limit(limit).all()
+        session.close()
+        return posts
+
+    def get_pending_group_posts_batch(self, batch_key: str, limit: int = 10):
+        """أقدم المنشورات المعلقة بنفس batch_key (حتى لو لسه مستحقتش) عشان تتبعت مع بعض."""
+        session = self.get_session()
+        posts = session.query(GroupOutbox).filter(
+            GroupOutbox.batch_key == batch_key,
+            GroupOutbox.status == 'pending'
+        ).order_by(GroupOutbox.id).limit(limit).all()
+        session.close()
+        return posts
+
+    def mark_group_posts_sent(self, post_ids):
+        session = self.get_session()
+        session.execute(update(GroupOutbox).where(GroupOutbox.id.in_(post_ids)).values(status='sent', sent_at=datetime.datetime.now()))
+        session.commit()
+        session.close()
+
+    def reschedule_group_posts(self, post_ids, next_attempt_at: datetime.datetime, error: str = None, count_attempt: bool = True, give_up: bool = False):
+        session = self.get_session()
+        values = {'next_attempt_at': next_attempt_at, 'last_error': error}
+        if count_attempt:
+            values['attempts'] = GroupOutbox.attempts + 1
+        if give_up:
+            values['status'] = 'failed'
+        session.execute(update(GroupOutbox).where(GroupOutbox.id.in_(post_ids)).values(values))
+        session.commit()
+        session.close()
+
+class AsyncDatabase:
+    """واجهة غير متزامنة فوق Database.
+
+    كل عملية بتتنفذ في thread pool خاص بقاعدة البيانات عشان استعلامات SQLite
+    ماتوقفش الـ event loop بتاع aiogram. نفس أسماء الدوال موجودة هنا لكن بترجع awaitables:
+    ``await db.get_user(user_id)``. دوال ``iter_*`` (generators) بترجع async iterators
+    بتسحب دفعة دفعة من الـ thread pool: ``async for batch in db.iter_users(): ...``.
+    """
+
+    def __init__(self, database: Database, max_workers: int = 4):
+        self.sync = database
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+
+    async def run(self, func, *args, **kwargs):
+        """تنفيذ دالة متزامنة في thread pool قاعدة البيانات مع الحفاظ على الـ contextvars."""
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, functools.partial(ctx.run, func, *args, **kwargs))
+
+    async def stream(self, func, *args, **kwargs):
+        """تشغيل generator متزامن في الـ thread pool وإرجاع دفعاته كـ async iterator."""
+        iterator = await self.run(func, *args, **kwargs)
+        done = object()
+        try:
+            while True:
+                batch = await self.run(next, iterator, done)
+                if batch is done:
+                    return
+                yield batch
+        finally:
+            await self.run(iterator.close)
+
+    def __getattr__(self, name):
+        attr = getattr(self.sync, name)
+        if not callable(attr):
+            return attr
+
+        if pyinspect.isgeneratorfunction(attr):
+            @functools.wraps(attr)
+            def stream_wrapper(*args, **kwargs):
+                return self.stream(attr, *args, **kwargs)
+
+            return stream_wrapper
+
+        @functools.wraps(attr)
+        async def wrapper(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        return wrapper
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.sync.engine.dispose()
@@ -0,0 +1,115 @@
+import csv
+import io
+import re
+
+from aiogram.types import BufferedInputFile
+
+try:
+    from openpyxl import Workbook
+except ImportError: # openpyxl اختياري: لو مش متسطب التقارير بتطلع CSV
+    Workbook = None
+
+# حد تليجرام لطول الرسالة الواحدة (4096) ناقص هامش بسيط
+MESSAGE_CHUNK_SIZE = 4000
+
+
+class ReportDocumentBuilder:
+    """بناء ملف تقرير (CSV أو XLSX) صف بصف، عشان التقرير يتكتب وهو بيتقرا دفعات من قاعدة البيانات
+    من غير ما نحتفظ بكل الصفوف في الذاكرة. XLSX بيرجع لـ CSV لو openpyxl مش موجود."""
+
+    def __init__(self, filename: str, headers, export_format: str = "csv"):
+        self.filename = filename
+        self.row_count = 0
+        self._xlsx = export_format == "xlsx" and Workbook is not None
+        if self._xlsx:
+            self._workbook = Workbook(write_only=True)
+            self._sheet = self._workbook.create_sheet()
+            self._sheet.append(list(headers))
+        else:
+            self._buffer = io.StringIO()
+            self._writer = csv.writer(self._buffer)
+            self._writer.writerow(headers)
+
+    def add_rows(self, rows):
+        for row in rows:
+            if self._xlsx:
+                self._sheet.append(list(row))
+            else:
+                self._writer.writerow(row)
+            self.row_count += 1
+
+    def build(self) -> BufferedInputFile:
+        if self._xlsx:
+            buffer = io.BytesIO()
+            self._workbook.save(buffer)
+            return BufferedInputFile(buffer.getvalue(), filename=f"{self.filename}.xlsx")
+        # UTF-8 مع BOM عشان Excel يقرا العربي صح
+        return BufferedInputFile(self._buffer.getvalue().encode("utf-8-sig"), filename=f"{self.filename}.csv")
+
+
+# في parse_mode='Markdown' (القديم) كل * أو _ أو ` لوحده بيفتح/يقفل تنسيق (و ** مجرد زوج فاضي)،
+# و ``` بيفتح/يقفل بلوك كود. بره أي تنسيق الـ \ بيهرب الحرف اللي بعده، وجوه التنسيق مفيش تهريب
+_MARKDOWN_SPECIAL = re.compile(r"([*_`\[])")
+
+
+def escape_markdown(value) -> str:
+    """تهريب قيمة من المستخدم (اسم، قناة...) قبل ما تتحط في رسالة Markdown بره أي تنسيق."""
+    return _MARKDOWN_SPECIAL.sub(r"\\\1", str(value))
+
+
+def _balance_entities(chunk: str):
+    """قفل أي تنسيق Markdown مفتوح في آخر الجزء، وبيرجع التنسيق اللي لازم يتفتح تاني في أول الجزء اللي بعده.
+    Markdown القديم مابيسمحش بتنسيق جوه تنسيق، فبيكون فيه تنسيق واحد مفتوح بالكتير."""
+    open_entity = ""
+    i = 0
+    while i < len(chunk):
+        if open_entity:
+            if chunk.startswith(open_entity, i):
+                i += len(open_entity)
+                open_entity = ""
+                continue
+        elif chunk[i] == "\\":
+            i += 2
+            continue
+        elif chunk.startswith("```", i):
+            open_entity = "```"
+            i += 3
+            continue
+        elif chunk[i] in "*_`":
+            open_entity = chunk[i]
+        i += 1
+    return chunk + open_entity, open_entity
+
+
+def split_markdown(text: str, limit: int = MESSAGE_CHUNK_SIZE):
+    """تقسيم نص Markdown طويل لرسائل تليجرام من غير ما نقطع التنسيق في النص.
+
+    التقسيم بيكون على حدود السطور، والسطر الأطول من الحد بيتقسم على المسافات. لو التقسيم
+    وقع جوه تنسيق (زي *...* أو `...`) بيتقفل في آخر الرسالة ويتفتح تاني في أول اللي بعدها.
+    """
+    # هامش للتنسيقات اللي ممكن تتقفل/تتفتح على حدود الرسايل
+    budget = limit - 8
+    pieces = []
+    for line in text.split("\n"):
+        while len(line) > budget:
+            cut = line.rfind(" ", 0, budget)
+            if cut <= 0:
+                cut = budget
+            pieces.append(line[:cut])
+            line = line[cut:].lstrip(" ")
+        pieces.append(line)
+
+    chunks = []
+    current = ""
+    reopen = ""
+    for piece in pieces:
+        candidate = piece if not current else current + "\n" + piece
+        if current and len(candidate) > budget:
+            closed, reopen = _balance_entities(current)
+            chunks.append(closed)
+            current = reopen + piece
+        else:
+            current = candidate
+    if current.strip():
+        chunks.append(_balance_entities(current)[0])
+    return chunks
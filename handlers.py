@@ -1,17 +1,56 @@
 import datetime
+import logging
 from aiogram import Router, F, Bot
 from aiogram.filters import Command, StateFilter
-from aiogram.types import Message, CallbackQuery, InputMediaVideo, FSInputFile
+from aiogram.types import Message, CallbackQuery, FSInputFile, ReplyKeyboardMarkup, KeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from config import GROUP_ID, ADMIN_ID, LONG_VIDEO_COOLDOWN_DAYS, REQUIRED_SHORT_VIDEOS_DAILY
-from database import Database
+from config import GROUP_ID, ADMIN_ID, LONG_VIDEO_COOLDOWN_DAYS, REQUIRED_SHORT_VIDEOS_DAILY, DB_NAME, DB_EXECUTOR_WORKERS, USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS, BROADCAST_RATE_PER_SECOND, BROADCAST_CONCURRENCY, BROADCAST_PROGRESS_INTERVAL_SECONDS, GROUP_POSTS_PER_MINUTE, GROUP_POST_MAX_ATTEMPTS, GROUP_MEDIA_BATCH_WINDOW_SECONDS, GROUP_MEDIA_BATCH_MAX, REPORT_EXPORT_FORMAT, COMMITMENT_SNAPSHOT_INTERVAL_MINUTES, SQLITE_PROFILE, SQLITE_PRAGMA_OVERRIDES, SQLITE_POOL_SIZE, SQLITE_WAL_CHECKPOINT_SECONDS
+from database import Database, AsyncDatabase, sqlite_profile
 from keyboards import get_main_menu_keyboard, stats_keyboard, about_work_inline_keyboard, admin_menu_keyboard, commitment_menu_keyboard
+from broadcast import BroadcastEngine, payload_from_message
+from outbox import GroupOutboxDispatcher
+from exports import ReportDocumentBuilder, split_markdown, escape_markdown
+from scheduler import CommitmentSnapshotScheduler, WalCheckpointer
 import messages as msg_texts
 
-# تهيئة قاعدة البيانات
-db = Database()
+logger = logging.getLogger(__name__)
+
+# تهيئة قاعدة البيانات (كل الاستعلامات بتتنفذ في thread pool عشان ماتوقفش الـ event loop)
+db = AsyncDatabase(
+    Database(DB_NAME, user_cache_size=USER_CACHE_SIZE, user_cache_ttl=USER_CACHE_TTL_SECONDS,
+             pragmas=sqlite_profile(SQLITE_PROFILE, **SQLITE_PRAGMA_OVERRIDES), pool_size=SQLITE_POOL_SIZE),
+    max_workers=DB_EXECUTOR_WORKERS
+)
+
+# محرك الرسائل الجماعية (بيشتغل في الخلفية بمعدل إرسال محدود)
+broadcaster = BroadcastEngine(
+    db,
+    rate=BROADCAST_RATE_PER_SECOND,
+    concurrency=BROADCAST_CONCURRENCY,
+    progress_interval=BROADCAST_PROGRESS_INTERVAL_SECONDS
+)
+
+# outbox منشورات جروب المراجعة (الإرسال للجروب بيتم في الخلفية بعد الرد على المستخدم)
+group_outbox = GroupOutboxDispatcher(
+    db,
+    rate_per_minute=GROUP_POSTS_PER_MINUTE,
+    max_attempts=GROUP_POST_MAX_ATTEMPTS,
+    media_batch_window=GROUP_MEDIA_BATCH_WINDOW_SECONDS,
+    media_batch_max=GROUP_MEDIA_BATCH_MAX,
+    admin_chat_id=ADMIN_ID
+)
+
+# لقطات الالتزام المحسوبة مسبقاً لتقارير المشرف (بتتحدث في الخلفية)
+commitment_snapshots = CommitmentSnapshotScheduler(
+    db,
+    required_daily=REQUIRED_SHORT_VIDEOS_DAILY,
+    interval_minutes=COMMITMENT_SNAPSHOT_INTERVAL_MINUTES
+)
+
+# checkpoint دوري لملف الـ WAL عشان مايكبرش مع الكتابة المستمرة
+wal_checkpointer = WalCheckpointer(db, interval_seconds=SQLITE_WAL_CHECKPOINT_SECONDS)
 
 # راوتر لمعالجة الرسائل
 router = Router()
@@ -39,30 +78,34 @@ def is_admin(user_id: int) -> bool:
     return user_id == ADMIN_ID
 
 async def _get_user_stats_for_caption(user_id: int):
-    """جلب إحصائيات المستخدم اللازمة لتنسيق الكابشن الموحد."""
-    user = db.get_user(user_id)
-    if not user:
-        return None, None, None, None, None, None # ارجع قيم None إذا لم يتم العثور على المستخدم
-
-    short_today = db.get_today_videos_count(user_id, 'short')
-    short_weekly = db.get_weekly_videos_count(user_id, 'short')
-    long_today = db.get_today_videos_count(user_id, 'long')
-    long_weekly = db.get_weekly_videos_count(user_id, 'long')
-    
-    return user, short_today, short_weekly, long_today, long_weekly
-
-async def _generate_standard_group_caption(user_id: int, type_label: str, additional_info: str = ""):
-    """توليد الكابشن الموحد لرسائل المجموعة."""
+    """جلب إحصائيات المستخدم اللازمة لتنسيق الكابشن الموحد (استعلام واحد)."""
+    caption_stats = await db.get_caption_stats(user_id)
+    if not caption_stats:
+        return None, None, None, None, None # ارجع قيم None إذا لم يتم العثور على المستخدم
+    return caption_stats
+
+async def _generate_standard_group_caption(user_id: int, type_label: str, additional_info: str = "", submission: tuple = None):
+    """توليد الكابشن الموحد لرسائل المجموعة.
+    submission: (نوع الفيديو، النقاط) لفيديو لسه هيتسجل مع المنشور، فالإحصائيات بتتحسب شاملاه."""
     user, short_today, short_weekly, long_today, long_weekly = await _get_user_stats_for_caption(user_id)
     
     if not user:
         return "بيانات المستخدم غير متوفرة."
 
+    points = user.points
+    if submission:
+        video_type, added_points = submission
+        points += added_points
+        if video_type == 'short':
+            short_today, short_weekly = short_today + 1, short_weekly + 1
+        else:
+            long_today, long_weekly = long_today + 1, long_weekly + 1
+
     return msg_texts.GROUP_CAPTION_FORMAT.format(
         type_label=type_label,
-        name=user.name,
-        channel_name=user.channel_name,
-        points=user.points,
+        name=escape_markdown(user.name),
+        channel_name=escape_markdown(user.channel_name),
+        points=points,
         short_today=short_today,
         short_weekly=short_weekly,
         long_today=long_today,
@@ -75,9 +118,12 @@ async def _generate_standard_group_caption(user_id: int, type_label: str, additi
 @router.message(Command("start"))
 async def start_command(message: Message, state: FSMContext):
     user_id = message.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
 
     if user:
+        if not user.is_reachable:
+            # المستخدم رجع فتح البوت بعد ما كان حاظره: يرجع لقائمة المستلمين
+            await db.mark_user_reachable(user_id)
         await message.answer(msg_texts.MSG_WELCOME_BACK, reply_markup=get_main_menu_keyboard(user_id))
         await state.clear()
     else:
@@ -104,7 +150,7 @@ async def get_age(message: Message, state: FSMContext):
         await state.update_data(age=age)
         await message.answer(msg_texts.MSG_GET_CHANNEL)
         await state.set_state(RegistrationStates.getting_channel)
-    except ValueError:
+    except (TypeError, ValueError): # TypeError: الرسالة مش نص (فيديو/صورة)
         await message.answer(msg_texts.MSG_INVALID_AGE)
 
 # --- معالج استلام اسم القناة (للتسجيل) ---
@@ -119,7 +165,7 @@ async def get_channel(message: Message, state: FSMContext):
     channel_name = message.text
     user_id = message.from_user.id
 
-    if db.add_user(user_id, name, age, channel_name):
+    if await db.add_user(user_id, name, age, channel_name):
         await message.answer(msg_texts.MSG_REGISTRATION_SUCCESS, reply_markup=get_main_menu_keyboard(user_id))
     else:
         await message.answer(msg_texts.MSG_ALREADY_REGISTERED, reply_markup=get_main_menu_keyboard(user_id))
@@ -135,7 +181,7 @@ async def back_to_main_menu(message: Message, state: FSMContext):
 @router.message(F.text == "🎞️ فيديوهات 1 دقيقة")
 async def handle_short_video_button(message: Message, state: FSMContext):
     user_id = message.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     if not user:
         await message.answer(msg_texts.MSG_NOT_REGISTERED)
         await state.clear()
@@ -147,35 +193,31 @@ async def handle_short_video_button(message: Message, state: FSMContext):
 @router.message(F.video, StateFilter("waiting_for_short_video"))
 async def process_short_video(message: Message, state: FSMContext):
     user_id = message.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     if not user:
         await message.answer(msg_texts.MSG_NOT_REGISTERED)
         await state.clear()
         return
 
     # لا يوجد تحقق من مدة الفيديو القصير هنا - يتم تحويله مباشرة
-    # تسجيل الفيديو في قاعدة البيانات
-    db.record_video(user_id, 'short', 1)
-    db.update_last_activity(user_id) # تحديث آخر نشاط
-
-    # بناء الكابشن الموحد للمجموعة
+    # بناء الكابشن الموحد للمجموعة (شامل الفيديو ده)
     caption = await _generate_standard_group_caption(
         user_id, 
-        type_label="فيديو قصير (1 دقيقة)"
+        type_label="فيديو قصير (1 دقيقة)",
+        submission=('short', 1)
     )
 
-    # إعادة توجيه الفيديو إلى المجموعة مع الكابشن
-    try:
-        await message.bot.send_video(chat_id=GROUP_ID, video=message.video.file_id, caption=caption, parse_mode='Markdown')
-        await message.answer("✅ تم استلام الفيديو القصير وإرساله للمجموعة.")
-    except Exception as e:
-        await message.answer(f"حدث خطأ أثناء إرسال الفيديو للمجموعة: {e}")
-        # يمكن تسجيل الخطأ في اللوج
-        print(f"Error sending short video to group: {e}")
-
+    # تسجيل الفيديو والنقاط وآخر نشاط ومنشور الجروب في transaction واحد
+    # (الفيديوهات القصيرة المتتالية بتتجمع في منشور واحد)
+    await db.record_submission(
+        user_id, 'short', 1,
+        group_post=group_outbox.video_post(GROUP_ID, message.video.file_id, caption, batch_key=f"short:{user_id}")
+    )
+    group_outbox.notify()
+    await message.answer("✅ تم استلام الفيديو القصير وهيتبعت للمجموعة.")
 
     # رسائل تحفيزية بناءً على عدد الفيديوهات القصيرة اليومية
-    short_videos_today = db.get_today_videos_count(user_id, 'short')
+    short_videos_today = await db.get_today_videos_count(user_id, 'short')
     if short_videos_today < REQUIRED_SHORT_VIDEOS_DAILY:
         await message.answer(msg_texts.MSG_SHORT_VIDEO_COUNT.format(count=short_videos_today, required_count=REQUIRED_SHORT_VIDEOS_DAILY))
     elif short_videos_today == REQUIRED_SHORT_VIDEOS_DAILY:
@@ -189,7 +231,7 @@ async def process_short_video(message: Message, state: FSMContext):
 @router.message(F.text == "🎬 تجميعة فيديو 10 دقايق")
 async def handle_long_video_button(message: Message, state: FSMContext):
     user_id = message.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     if not user:
         await message.answer(msg_texts.MSG_NOT_REGISTERED)
         await state.clear()
@@ -210,7 +252,7 @@ async def handle_long_video_button(message: Message, state: FSMContext):
 @router.message(F.video, StateFilter("waiting_for_long_video"))
 async def process_long_video(message: Message, state: FSMContext):
     user_id = message.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     if not user:
         await message.answer(msg_texts.MSG_NOT_REGISTERED)
         await state.clear()
@@ -222,24 +264,18 @@ async def process_long_video(message: Message, state: FSMContext):
         await message.answer(msg_texts.MSG_INVALID_LONG_VIDEO)
         return
 
-    # تسجيل الفيديو في قاعدة البيانات
-    db.record_video(user_id, 'long', 10)
-    db.update_last_long_video_sent(user_id)
-    db.update_last_activity(user_id) # تحديث آخر نشاط
-
-    # بناء الكابشن الموحد للمجموعة
+    # بناء الكابشن الموحد للمجموعة (شامل الفيديو ده)
     caption = await _generate_standard_group_caption(
         user_id, 
-        type_label="فيديو طويل (10 دقائق أو أكثر)" # النص الظاهر 10 دقائق، لكن التحقق 5 دقائق
+        type_label="فيديو طويل (10 دقائق أو أكثر)", # النص الظاهر 10 دقائق، لكن التحقق 5 دقائق
+        submission=('long', 10)
     )
 
-    # إعادة توجيه الفيديو إلى المجموعة مع الكابشن
-    try:
-        await message.bot.send_video(chat_id=GROUP_ID, video=message.video.file_id, caption=caption, parse_mode='Markdown')
-        await message.answer("✅ تم استلام الفيديو الطويل وإرساله للمجموعة.")
-    except Exception as e:
-        await message.answer(f"حدث خطأ أثناء إرسال الفيديو للمجموعة: {e}")
-        print(f"Error sending long video to group: {e}")
+    # تسجيل الفيديو (بيحدث كمان تاريخ آخر فيديو طويل) ومنشور الجروب في transaction واحد
+    # (الإرسال الفعلي للجروب بيتم في الخلفية)
+    await db.record_submission(user_id, 'long', 10, group_post=group_outbox.video_post(GROUP_ID, message.video.file_id, caption))
+    group_outbox.notify()
+    await message.answer("✅ تم استلام الفيديو الطويل وهيتبعت للمجموعة.")
 
     await state.clear() # مسح الحالة بعد استقبال الفيديو
 
@@ -248,7 +284,7 @@ async def process_long_video(message: Message, state: FSMContext):
 @router.message(F.text == "📊 إحصائياتي")
 async def handle_stats_button(message: Message, state: FSMContext):
     user_id = message.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     if not user:
         await message.answer(msg_texts.MSG_NOT_REGISTERED)
         await state.clear()
@@ -260,23 +296,16 @@ async def handle_stats_button(message: Message, state: FSMContext):
 @router.message(F.text == "اليوم", StateFilter("waiting_for_stats_choice"))
 async def show_today_stats(message: Message, state: FSMContext):
     user_id = message.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     if not user:
         await message.answer(msg_texts.MSG_NOT_REGISTERED)
         await state.clear()
         return
 
-    short_count = db.get_today_videos_count(user_id, 'short')
-    long_count = db.get_today_videos_count(user_id, 'long')
+    short_count = await db.get_today_videos_count(user_id, 'short')
+    long_count = await db.get_today_videos_count(user_id, 'long')
 
-    session = db.get_session()
-    today = datetime.date.today()
-    videos_today = session.query(db.Video).filter(
-        db.Video.user_id == user_id,
-        func.DATE(db.Video.sent_at) == today
-    ).all()
-    session.close()
-    points_today = sum(video.points_earned for video in videos_today)
+    points_today = await db.get_today_points(user_id)
 
     await message.answer(
         msg_texts.MSG_STATS_TODAY.format(
@@ -292,17 +321,13 @@ async def show_today_stats(message: Message, state: FSMContext):
 @router.message(F.text == "آخر 30 يوم", StateFilter("waiting_for_stats_choice"))
 async def show_30_days_stats(message: Message, state: FSMContext):
     user_id = message.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     if not user:
         await message.answer(msg_texts.MSG_NOT_REGISTERED)
         await state.clear()
         return
 
-    videos_last_30_days = db.get_user_videos_in_last_30_days(user_id)
-
-    short_total = sum(1 for v in videos_last_30_days if v.type == 'short')
-    long_total = sum(1 for v in videos_last_30_days if v.type == 'long')
-    points_total = sum(v.points_earned for v in videos_last_30_days)
+    short_total, long_total, points_total = await db.get_stats_for_last_days(user_id, 30)
 
     await message.answer(
         msg_texts.MSG_STATS_LAST_30_DAYS.format(
@@ -320,7 +345,7 @@ async def show_30_days_stats(message: Message, state: FSMContext):
 @router.message(F.text == "💢 مشكلة")
 async def handle_issue_button(message: Message, state: FSMContext):
     user_id = message.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     if not user:
         await message.answer(msg_texts.MSG_NOT_REGISTERED)
         await state.clear()
@@ -331,36 +356,32 @@ async def handle_issue_button(message: Message, state: FSMContext):
 @router.message(StateFilter(IssueQuestionStates.waiting_for_issue))
 async def process_issue(message: Message, state: FSMContext):
     user_id = message.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     if not user:
         await message.answer(msg_texts.MSG_NOT_REGISTERED)
         await state.clear()
         return
 
     issue_text = message.text
-    db.update_last_activity(user_id) # تحديث آخر نشاط
+    await db.update_last_activity(user_id) # تحديث آخر نشاط
 
     # بناء الكابشن الموحد للمجموعة
-    additional_info = f"**المشكلة:**\n{issue_text}"
+    additional_info = f"**المشكلة:**\n{escape_markdown(issue_text)}"
     caption = await _generate_standard_group_caption(
         user_id,
         type_label="💢 مشكلة من مستخدم",
         additional_info=additional_info
     )
     
-    try:
-        await message.bot.send_message(chat_id=GROUP_ID, text=caption, parse_mode='Markdown')
-        await message.answer(msg_texts.MSG_ISSUE_RECEIVED_CONFIRMATION, reply_markup=get_main_menu_keyboard(user_id))
-    except Exception as e:
-        await message.answer(f"حدث خطأ أثناء إرسال المشكلة: {e}")
-        print(f"Error sending issue to group: {e}")
+    await group_outbox.enqueue_message(GROUP_ID, caption)
+    await message.answer(msg_texts.MSG_ISSUE_RECEIVED_CONFIRMATION, reply_markup=get_main_menu_keyboard(user_id))
     await state.clear()
 
 # --- معالج زر (❓ استفسار) ---
 @router.message(F.text == "❓ استفسار")
 async def handle_question_button(message: Message, state: FSMContext):
     user_id = message.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     if not user:
         await message.answer(msg_texts.MSG_NOT_REGISTERED)
         await state.clear()
@@ -371,29 +392,25 @@ async def handle_question_button(message: Message, state: FSMContext):
 @router.message(StateFilter(IssueQuestionStates.waiting_for_question))
 async def process_question(message: Message, state: FSMContext):
     user_id = message.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     if not user:
         await message.answer(msg_texts.MSG_NOT_REGISTERED)
         await state.clear()
         return
 
     question_text = message.text
-    db.update_last_activity(user_id) # تحديث آخر نشاط
+    await db.update_last_activity(user_id) # تحديث آخر نشاط
 
     # بناء الكابشن الموحد للمجموعة
-    additional_info = f"**الاستفسار:**\n{question_text}"
+    additional_info = f"**الاستفسار:**\n{escape_markdown(question_text)}"
     caption = await _generate_standard_group_caption(
         user_id,
         type_label="❓ استفسار من مستخدم",
         additional_info=additional_info
     )
 
-    try:
-        await message.bot.send_message(chat_id=GROUP_ID, text=caption, parse_mode='Markdown')
-        await message.answer(msg_texts.MSG_QUESTION_RECEIVED_CONFIRMATION, reply_markup=get_main_menu_keyboard(user_id))
-    except Exception as e:
-        await message.answer(f"حدث خطأ أثناء إرسال الاستفسار: {e}")
-        print(f"Error sending question to group: {e}")
+    await group_outbox.enqueue_message(GROUP_ID, caption)
+    await message.answer(msg_texts.MSG_QUESTION_RECEIVED_CONFIRMATION, reply_markup=get_main_menu_keyboard(user_id))
     await state.clear()
 
 # --- معالج زر (📋 عن الشغل و تفاصيله) ---
@@ -404,7 +421,7 @@ async def handle_about_work_button(message: Message):
 @router.callback_query(F.data == "start_work_agreement")
 async def process_start_work_agreement(callback_query: CallbackQuery):
     user_id = callback_query.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
 
     if not user:
         await callback_query.message.answer(msg_texts.MSG_NOT_REGISTERED, reply_markup=get_main_menu_keyboard(user_id))
@@ -471,90 +488,117 @@ async def cancel_broadcast(message: Message, state: FSMContext):
 @router.message(StateFilter(AdminStates.waiting_for_broadcast_message))
 async def admin_broadcast_message(message: Message, state: FSMContext, bot: Bot):
     await state.clear() # مسح الحالة بعد استلام الرسالة
-    
-    all_users = db.get_all_users()
-    sent_count = 0
-    failed_count = 0
-
-    for user in all_users:
-        if user.user_id == ADMIN_ID: # لا ترسل الرسالة للمشرف نفسه مرة أخرى
-            continue
-        try:
-            if message.text:
-                await bot.send_message(chat_id=user.user_id, text=message.text, parse_mode='Markdown')
-            elif message.photo:
-                await bot.send_photo(chat_id=user.user_id, photo=message.photo[-1].file_id, caption=message.caption, parse_mode='Markdown')
-            elif message.video:
-                await bot.send_video(chat_id=user.user_id, video=message.video.file_id, caption=message.caption, parse_mode='Markdown')
-            elif message.audio:
-                await bot.send_audio(chat_id=user.user_id, audio=message.audio.file_id, caption=message.caption, parse_mode='Markdown')
-            elif message.document:
-                await bot.send_document(chat_id=user.user_id, document=message.document.file_id, caption=message.caption, parse_mode='Markdown')
-            else:
-                # Handle other types if necessary, or just skip
-                pass
-            sent_count += 1
-            await asyncio.sleep(0.05) # تأخير بسيط لتجنب حدود معدل تليجرام
-        except Exception as e:
-            failed_count += 1
-            print(f"Failed to send broadcast to user {user.user_id}: {e}")
-            # ممكن تسجل المستخدمين اللي فشلت في إرسال الرسالة لهم هنا
-
-    if sent_count > 0:
-        await message.answer(msg_texts.MSG_BROADCAST_SUCCESS.format(count=sent_count), reply_markup=admin_menu_keyboard)
-    if failed_count > 0:
-        await message.answer(msg_texts.MSG_BROADCAST_FAILED.format(failed_count=failed_count), reply_markup=admin_menu_keyboard)
-    
+
+    payload = payload_from_message(message)
+    if payload is None:
+        await message.answer(msg_texts.MSG_BROADCAST_PROMPT)
+        await state.set_state(AdminStates.waiting_for_broadcast_message)
+        return
+
+    # الرسالة بتتسجل في قاعدة البيانات والإرسال بيتم في الخلفية عشان الهاندلر يرجع فوراً
+    # (المشرف نفسه مستبعد من المستلمين)
+    job_id, total = await broadcaster.create_and_start(bot, payload, admin_chat_id=message.chat.id, reply_markup=admin_menu_keyboard)
+    await message.answer(msg_texts.MSG_BROADCAST_STARTED.format(job_id=job_id, total=total), reply_markup=admin_menu_keyboard)
+
     await state.set_state(AdminStates.in_admin_panel) # الرجوع لحالة لوحة المشرف
 
+# --- متابعة الرسائل الجماعية (للمشرف) ---
+@router.message(F.text == "📡 متابعة الرسائل الجماعية", StateFilter(AdminStates.in_admin_panel))
+async def admin_broadcast_jobs_status(message: Message):
+    jobs = await db.get_recent_broadcast_jobs(5)
+    if not jobs:
+        await message.answer(msg_texts.MSG_NO_BROADCAST_JOBS)
+        return
+
+    lines = [msg_texts.MSG_BROADCAST_JOBS_HEADER]
+    for job in jobs:
+        lines.append(msg_texts.MSG_BROADCAST_JOB_DETAIL.format(
+            job_id=job.id,
+            status=msg_texts.BROADCAST_STATUS_LABELS.get(job.status, msg_texts.BROADCAST_STATUS_LABELS['running']),
+            created_at=job.created_at.strftime('%Y-%m-%d %H:%M'),
+            done=job.sent_count + job.failed_count,
+            total=job.total_count,
+            sent=job.sent_count,
+            failed=job.failed_count,
+            pruned=job.pruned_count
+        ))
+    await message.answer("\n".join(lines), parse_mode='Markdown')
+
+# --- إرسال التقارير كملفات ---
+async def _send_report(message: Message, summary: str, builder: ReportDocumentBuilder, build_inline_report):
+    """إرسال ملخص قصير + ملف التقرير (CSV/XLSX). لو إرسال الملف فشل بنرجع لعرض التقرير كرسائل مقسمة."""
+    await message.answer(summary, parse_mode='Markdown')
+    try:
+        await message.answer_document(builder.build())
+    except Exception as e:
+        logger.error("Failed to send report document %s, falling back to inline messages: %s", builder.filename, e)
+        for chunk in split_markdown(await build_inline_report()):
+            await message.answer(chunk, parse_mode='Markdown')
+
+def _users_report_row(index: int, row):
+    user_id, name, age, channel_name, points, registration_date, total_short, total_long, last_video_type, last_video_sent_at = row
+    if not last_video_sent_at:
+        last_video_type_label = "لا يوجد"
+    else:
+        last_video_type_label = "قصير" if last_video_type == 'short' else "طويل"
+    return (
+        index,
+        name,
+        user_id,
+        age if age else 'غير محدد',
+        channel_name,
+        points,
+        registration_date.strftime('%Y-%m-%d %H:%M'),
+        total_short,
+        total_long,
+        last_video_type_label,
+        last_video_sent_at.strftime('%Y-%m-%d %H:%M') if last_video_sent_at else ''
+    )
+
 # --- بيانات وإحصائيات المستخدمين (للمشرف) ---
 @router.message(F.text == "📈 بيانات وإحصائيات المستخدمين", StateFilter(AdminStates.in_admin_panel))
 async def admin_users_stats_report(message: Message):
-    all_users = db.get_all_users()
-    total_users = len(all_users)
-    total_short_videos_all = db.get_total_videos_count('short')
-    total_long_videos_all = db.get_total_videos_count('long')
-
-    users_details_list = []
-    if all_users:
-        sorted_users = sorted(all_users, key=lambda user: user.points, reverse=True) # الترتيب حسب النقاط
-        for i, user in enumerate(sorted_users):
-            user_short_videos = db.get_total_short_videos_sent_by_user(user.user_id)
-            user_long_videos = db.get_total_long_videos_sent_by_user(user.user_id)
-            
-            last_video = db.get_last_video_sent_details(user.user_id)
-            last_video_details = "لا يوجد"
-            if last_video:
-                last_video_type = "قصير" if last_video.type == 'short' else "طويل"
-                last_video_details = f"{last_video_type} في {last_video.sent_at.strftime('%Y-%m-%d %H:%M')}"
-
-            users_details_list.append(
-                msg_texts.MSG_USER_REPORT_DETAIL.format(
-                    index=i+1,
-                    name=user.name,
-                    user_id=user.user_id,
-                    age=user.age if user.age else 'غير محدد',
-                    channel_name=user.channel_name,
-                    points=user.points,
-                    reg_date=user.registration_date.strftime('%Y-%m-%d %H:%M'),
-                    total_short=user_short_videos,
-                    total_long=user_long_videos,
-                    last_video_details=last_video_details
+    total_short_videos_all = await db.get_total_videos_count('short')
+    total_long_videos_all = await db.get_total_videos_count('long')
+
+    # التقرير بيتكتب في الملف دفعة دفعة من استعلام واحد مرتب حسب النقاط
+    builder = ReportDocumentBuilder(f"users_report_{datetime.date.today():%Y-%m-%d}", msg_texts.USERS_REPORT_COLUMNS, REPORT_EXPORT_FORMAT)
+    async for batch in db.iter_users_report():
+        builder.add_rows([_users_report_row(builder.row_count + i + 1, row) for i, row in enumerate(batch)])
+    total_users = builder.row_count
+
+    async def build_inline_report():
+        users_details_list = []
+        async for batch in db.iter_users_report():
+            for row in batch:
+                index, name, user_id, age, channel_name, points, reg_date, total_short, total_long, last_type, last_at = \
+                    _users_report_row(len(users_details_list) + 1, row)
+                users_details_list.append(
+                    msg_texts.MSG_USER_REPORT_DETAIL.format(
+                        index=index,
+                        name=escape_markdown(name),
+                        user_id=user_id,
+                        age=age,
+                        channel_name=escape_markdown(channel_name),
+                        points=points,
+                        reg_date=reg_date,
+                        total_short=total_short,
+                        total_long=total_long,
+                        last_video_details=f"{last_type} في {last_at}" if last_at else last_type
+                    )
                 )
-            )
-    else:
-        users_details_list.append(msg_texts.MSG_NO_USERS_DATA)
+        return msg_texts.MSG_ALL_USERS_REPORT_HEADER.format(
+            total_users=total_users,
+            total_short_videos=total_short_videos_all,
+            total_long_videos=total_long_videos_all
+        ) + "\n".join(users_details_list or [msg_texts.MSG_NO_USERS_DATA])
 
-    report = msg_texts.MSG_ALL_USERS_REPORT_HEADER.format(
+    summary = msg_texts.MSG_ALL_USERS_REPORT_SUMMARY.format(
         total_users=total_users,
         total_short_videos=total_short_videos_all,
         total_long_videos=total_long_videos_all
-    ) + "\n".join(users_details_list)
-
-    # يمكن أن يكون التقرير طويلاً، لذا نقسمه إلى رسائل
-    chunk_size = 4000 # حد أقصى للرسالة في تليجرام
-    for i in range(0, len(report), chunk_size):
-        await message.answer(report[i:i+chunk_size], parse_mode='Markdown')
+    )
+    await _send_report(message, summary, builder, build_inline_report)
 
 # --- ملتزم ولا غير ملتزم (للمشرف) ---
 @router.message(F.text == "✅ ملتزم ولا غير ملتزم", StateFilter(AdminStates.in_admin_panel))
@@ -568,156 +612,97 @@ async def back_to_admin_menu_from_commitment(message: Message, state: FSMContext
     await message.answer(msg_texts.MSG_ADMIN_MENU, reply_markup=admin_menu_keyboard)
     await state.set_state(AdminStates.in_admin_panel)
 
+# --- تقارير الالتزام (مشتركة بين اليومي والأسبوعي والشهري) ---
+def _commitment_row(index: int, row, required_count: int):
+    """صف تقرير الالتزام + حالة المستخدم ('met' أو 'missed' أو 'none')."""
+    user_id, name, age, channel_name, registration_date, short_count, long_count, points = row
+    if short_count >= required_count:
+        status = 'met'
+    elif short_count > 0 or long_count > 0: # لو عنده أي نشاط بس مكملش المطلوب
+        status = 'missed'
+    else: # لو مفيش أي نشاط أصلاً
+        status = 'none'
+    return (
+        index,
+        name,
+        channel_name,
+        age if age else 'غير محدد',
+        registration_date.strftime('%Y-%m-%d %H:%M'),
+        points,
+        short_count,
+        long_count,
+        required_count,
+        msg_texts.COMMITMENT_STATUS_LABELS[status]
+    ), status
+
+async def _send_commitment_report(message: Message, period_key: str, period: str, period_text: str, filename_prefix: str):
+    # آخر لقطة محسوبة + الفيديوهات اللي اتبعتت بعدها (المطلوب بيتحسب مع اللقطة)
+    run = await commitment_snapshots.ensure_fresh(period_key)
+    required_count = run.required_shorts
+    builder = ReportDocumentBuilder(f"{filename_prefix}_{run.period_start:%Y-%m-%d}", msg_texts.COMMITMENT_REPORT_COLUMNS, REPORT_EXPORT_FORMAT)
+    status_counts = {'met': 0, 'missed': 0, 'none': 0}
+    async for batch in db.iter_commitment_report(period_key):
+        for row in batch:
+            export_row, status = _commitment_row(builder.row_count + 1, row, required_count)
+            builder.add_rows([export_row])
+            status_counts[status] += 1
+
+    async def build_inline_report():
+        report_parts = [msg_texts.MSG_COMMITMENT_REPORT_HEADER.format(period=period)]
+        async for batch in db.iter_commitment_report(period_key):
+            for row in batch:
+                (index, name, channel_name, age, reg_date, points, short_count, long_count, required, _), status = \
+                    _commitment_row(len(report_parts), row, required_count)
+                if status == 'met':
+                    commitment_status = msg_texts.MSG_USER_MET_TARGET.format(count=short_count, required_count=required)
+                elif status == 'missed':
+                    commitment_status = msg_texts.MSG_USER_MISSED_TARGET.format(count=short_count, required_count=required)
+                else:
+                    commitment_status = msg_texts.MSG_USER_NO_ACTIVITY
+                report_parts.append(
+                    msg_texts.MSG_COMMITMENT_USER_DETAIL.format(
+                        index=index,
+                        name=escape_markdown(name),
+                        channel_name=escape_markdown(channel_name),
+                        age=age,
+                        reg_date=reg_date,
+                        points=points,
+                        short_count=short_count,
+                        long_count=long_count,
+                        period_text=period_text,
+                        commitment_status=commitment_status
+                    )
+                )
+        if len(report_parts) == 1:
+            report_parts.append(msg_texts.MSG_NO_COMMITMENT_DATA_FOR_PERIOD)
+        return "\n".join(report_parts)
+
+    summary = msg_texts.MSG_COMMITMENT_REPORT_SUMMARY.format(
+        period=period,
+        total_users=builder.row_count,
+        required_count=required_count,
+        met=status_counts['met'],
+        missed=status_counts['missed'],
+        inactive=status_counts['none']
+    )
+    await _send_report(message, summary, builder, build_inline_report)
+
 # --- الشغل اليومي للمشرف ---
 @router.message(F.text == "☀️ الشغل اليومي", StateFilter(AdminStates.in_commitment_menu))
 async def admin_daily_commitment_report(message: Message):
-    today = datetime.date.today()
-    users_data = db.get_users_by_activity_in_period(today, today)
-
-    report_parts = [msg_texts.MSG_COMMITMENT_REPORT_HEADER.format(period="لليوم")]
-    
-    if not users_data:
-        report_parts.append(msg_texts.MSG_NO_COMMITMENT_DATA_FOR_PERIOD)
-    else:
-        for i, data in enumerate(users_data):
-            user = data['user']
-            commitment_status = ""
-            if data['short_videos_count'] >= REQUIRED_SHORT_VIDEOS_DAILY:
-                commitment_status = msg_texts.MSG_USER_MET_TARGET.format(
-                    count=data['short_videos_count'], 
-                    required_count=REQUIRED_SHORT_VIDEOS_DAILY
-                )
-            elif data['has_activity_in_period']: # لو عنده أي نشاط بس مكملش المطلوب
-                commitment_status = msg_texts.MSG_USER_MISSED_TARGET.format(
-                    count=data['short_videos_count'], 
-                    required_count=REQUIRED_SHORT_VIDEOS_DAILY
-                )
-            else: # لو مفيش أي نشاط أصلاً
-                commitment_status = msg_texts.MSG_USER_NO_ACTIVITY
-            
-            report_parts.append(
-                msg_texts.MSG_COMMITMENT_USER_DETAIL.format(
-                    index=i+1,
-                    name=user.name,
-                    channel_name=user.channel_name,
-                    age=user.age if user.age else 'غير محدد',
-                    reg_date=data['registration_date_str'],
-                    points=data['points_earned'],
-                    short_count=data['short_videos_count'],
-                    long_count=data['long_videos_count'],
-                    period_text="لليوم",
-                    commitment_status=commitment_status
-                )
-            )
-    
-    full_report = "\n".join(report_parts)
-    chunk_size = 4000
-    for i in range(0, len(full_report), chunk_size):
-        await message.answer(full_report[i:i+chunk_size], parse_mode='Markdown')
+    await _send_commitment_report(message, 'day', period="لليوم", period_text="لليوم", filename_prefix="daily_commitment")
 
 # --- الشغل الاسبوعي للمشرف ---
 @router.message(F.text == "🗓️ الشغل الاسبوعي", StateFilter(AdminStates.in_commitment_menu))
 async def admin_weekly_commitment_report(message: Message):
-    today = datetime.date.today()
-    start_of_week = today - datetime.timedelta(days=today.weekday())
-    users_data = db.get_users_by_activity_in_period(start_of_week, today)
-
-    report_parts = [msg_texts.MSG_COMMITMENT_REPORT_HEADER.format(period="للأسبوع")]
-    
-    if not users_data:
-        report_parts.append(msg_texts.MSG_NO_COMMITMENT_DATA_FOR_PERIOD)
-    else:
-        for i, data in enumerate(users_data):
-            user = data['user']
-            commitment_status = ""
-            # للالتزام الأسبوعي، ممكن نتحقق من متوسط الأداء أو إجمالي الفيديوهات القصيرة
-            # هنا نفترض الالتزام بإجمالي الشورتات خلال الأسبوع
-            required_weekly_shorts = REQUIRED_SHORT_VIDEOS_DAILY * (today.weekday() + 1) # المطلوب لليوم الحالي من الأسبوع
-            
-            if data['short_videos_count'] >= required_weekly_shorts:
-                commitment_status = msg_texts.MSG_USER_MET_TARGET.format(
-                    count=data['short_videos_count'], 
-                    required_count=required_weekly_shorts
-                )
-            elif data['has_activity_in_period']:
-                 commitment_status = msg_texts.MSG_USER_MISSED_TARGET.format(
-                    count=data['short_videos_count'], 
-                    required_count=required_weekly_shorts
-                )
-            else:
-                commitment_status = msg_texts.MSG_USER_NO_ACTIVITY
-
-            report_parts.append(
-                msg_texts.MSG_COMMITMENT_USER_DETAIL.format(
-                    index=i+1,
-                    name=user.name,
-                    channel_name=user.channel_name,
-                    age=user.age if user.age else 'غير محدد',
-                    reg_date=data['registration_date_str'],
-                    points=data['points_earned'],
-                    short_count=data['short_videos_count'],
-                    long_count=data['long_videos_count'],
-                    period_text="للأسبوع",
-                    commitment_status=commitment_status
-                )
-            )
-    
-    full_report = "\n".join(report_parts)
-    chunk_size = 4000
-    for i in range(0, len(full_report), chunk_size):
-        await message.answer(full_report[i:i+chunk_size], parse_mode='Markdown')
+    # للالتزام الأسبوعي: إجمالي الشورتات من أول الأسبوع مقابل المطلوب لحد النهارده
+    await _send_commitment_report(message, 'week', period="للأسبوع", period_text="للأسبوع", filename_prefix="weekly_commitment")
 
 # --- الشغل الشهري للمشرف ---
 @router.message(F.text == "⭐ الشغل الشهري", StateFilter(AdminStates.in_commitment_menu))
 async def admin_monthly_commitment_report(message: Message):
-    today = datetime.date.today()
-    start_of_month = today.replace(day=1)
-    users_data = db.get_users_by_activity_in_period(start_of_month, today)
-
-    report_parts = [msg_texts.MSG_COMMITMENT_REPORT_HEADER.format(period="للشهر")]
-    
-    if not users_data:
-        report_parts.append(msg_texts.MSG_NO_COMMITMENT_DATA_FOR_PERIOD)
-    else:
-        for i, data in enumerate(users_data):
-            user = data['user']
-            commitment_status = ""
-            # للالتزام الشهري، نتحقق من إجمالي الشورتات
-            # مطلوب يومي * عدد الأيام اللي مرت في الشهر
-            required_monthly_shorts = REQUIRED_SHORT_VIDEOS_DAILY * today.day 
-
-            if data['short_videos_count'] >= required_monthly_shorts:
-                commitment_status = msg_texts.MSG_USER_MET_TARGET.format(
-                    count=data['short_videos_count'], 
-                    required_count=required_monthly_shorts
-                )
-            elif data['has_activity_in_period']:
-                commitment_status = msg_texts.MSG_USER_MISSED_TARGET.format(
-                    count=data['short_videos_count'], 
-                    required_count=required_monthly_shorts
-                )
-            else:
-                commitment_status = msg_texts.MSG_USER_NO_ACTIVITY
-            
-            report_parts.append(
-                msg_texts.MSG_COMMITMENT_USER_DETAIL.format(
-                    index=i+1,
-                    name=user.name,
-                    channel_name=user.channel_name,
-                    age=user.age if user.age else 'غير محدد',
-                    reg_date=data['registration_date_str'],
-                    points=data['points_earned'],
-                    short_count=data['short_videos_count'],
-                    long_count=data['long_videos_count'],
-                    period_text="للشهر",
-                    commitment_status=commitment_status
-                )
-            )
-    
-    full_report = "\n".join(report_parts)
-    chunk_size = 4000
-    for i in range(0, len(full_report), chunk_size):
-        await message.answer(full_report[i:i+chunk_size], parse_mode='Markdown')
+    # للالتزام الشهري: مطلوب يومي * عدد الأيام اللي مرت في الشهر
+    await _send_commitment_report(message, 'month', period="للشهر", period_text="للشهر", filename_prefix="monthly_commitment")
 
 # --- معالج أي رسالة أخرى لا تتطابق مع الأوامر أو حالات FSM ---
 @router.message()
@@ -727,7 +712,7 @@ async def echo_message(message: Message, state: FSMContext):
         return # إذا كان المستخدم في حالة FSM، لا تفعل شيئاً هنا
 
     user_id = message.from_user.id
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     if not user:
         await message.answer(msg_texts.MSG_NOT_REGISTERED)
     else:
@@ -38,6 +38,7 @@ about_work_inline_keyboard = InlineKeyboardMarkup(
 admin_menu_keyboard = ReplyKeyboardMarkup(
     keyboard=[
         [KeyboardButton(text="✉️ رسالة للمستخدمين")],
+        [KeyboardButton(text="📡 متابعة الرسائل الجماعية")],
         [KeyboardButton(text="📈 بيانات وإحصائيات المستخدمين")],
         [KeyboardButton(text="✅ ملتزم ولا غير ملتزم")],
         [KeyboardButton(text="الرجوع للقائمة الرئيسية")]
@@ -1,14 +1,23 @@
 import asyncio
 import logging
+import multiprocessing
 import os
+import signal
+from typing import Optional
 from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.base import BaseSession
 from aiogram.enums import ParseMode
-from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_webhook
 from aiohttp import web
 
-from config import BOT_TOKEN, ADMIN_ID, DB_NAME
-from handlers import router
-from database import Database # للتأكد من تهيئة قاعدة البيانات عند بدء التشغيل
+from config import BOT_TOKEN, ADMIN_ID, FSM_STATE_TTL_SECONDS, FSM_CACHE_TTL_SECONDS, FSM_FLUSH_INTERVAL_SECONDS, QUERY_BUDGET_MODE, QUERY_BUDGET_DEFAULT, QUERY_BUDGETS, QUERY_BUDGET_REPEAT_THRESHOLD
+from handlers import router, db, broadcaster, group_outbox, commitment_snapshots, wal_checkpointer # db: واجهة قاعدة البيانات غير المتزامنة (بتنشئ الجداول عند الاستيراد)
+from keyboards import admin_menu_keyboard
+from middlewares import UserSerializationMiddleware
+from metrics import registry, metrics_view, instrument_engine, instrument_router, BotApiMetricsMiddleware
+from profiling import QueryBudgetMiddleware, install_query_profiler, instrument_query_budget, parse_budgets
+from storage import SQLiteStorage
+from update_queue import WebhookUpdateQueue
 
 # إعدادات الـ Webhook (إذا كنت ستنشر على Render.com أو Replit)
 WEB_SERVER_HOST = "0.0.0.0"
@@ -16,53 +25,247 @@ WEB_SERVER_HOST = "0.0.0.0"
 # Render.com أيضاً يستخدم "PORT"
 WEB_SERVER_PORT = int(os.getenv("PORT", 8000)) # الافتراضي 8000 لو مش موجود
 WEBHOOK_PATH = "/webhook"
+HEALTHCHECK_PATH = "/healthz"
+METRICS_PATH = "/metrics"
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "YOUR_WEBHOOK_SECRET_HERE") # استخدم متغير بيئة لـ Webhook Secret
 BASE_WEBHOOK_URL = os.getenv("BASE_WEBHOOK_URL", "YOUR_RENDER_APP_OR_REPLIT_URL_HERE") # رابط الـ Webhook العام
+# عدد عمليات الويب هوك اللي بتسمع على نفس المنفذ (SO_REUSEPORT). الكيرنل بيوزع الاتصالات على العمليات
+# من غير ما يعرف المستخدم، فترتيب تحديثات كل مستخدم مضمون بس مع عملية واحدة: لو WEBHOOK_PER_USER_ORDERING
+# شغال (الافتراضي) البوت بيشتغل بعملية واحدة، ولأكتر من عملية لازم يتقفل (WEBHOOK_PER_USER_ORDERING=0)
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+WEBHOOK_PER_USER_ORDERING = os.getenv("WEBHOOK_PER_USER_ORDERING", "1") != "0"
+# أقصى وقت بالثواني لانتظار التحديثات اللي بتتعالج وقت الإيقاف قبل قفل قاعدة البيانات
+WEB_SHUTDOWN_TIMEOUT_SECONDS = float(os.getenv("WEB_SHUTDOWN_TIMEOUT_SECONDS", "30"))
+# طابور التحديثات في كل عملية: أقصى عدد تحديثات منتظرة، أقصى عدد تحديثات بتتعالج في نفس الوقت (لمستخدمين مختلفين)،
+# وكام ثانية نستنى مكان في الطابور قبل ما نرد بـ 503
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_QUEUE_WORKERS = int(os.getenv("WEBHOOK_QUEUE_WORKERS", "16"))
+WEBHOOK_QUEUE_PUT_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_QUEUE_PUT_TIMEOUT_SECONDS", "2"))
 
 # إعداد التسجيل (Logging)
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    format='%(asctime)s - %(name)s - %(levelname)s - %(process)d - %(message)s'
 )
 
-async def main():
-    # تهيئة البوت والديسباتشر
-    bot = Bot(token=BOT_TOKEN, parse_mode=ParseMode.MARKDOWN) # تم تغيير ParseMode إلى Markdown لدعم التنسيق
-    dp = Dispatcher()
+# عدد وزمن استعلامات SQL في /metrics
+instrument_engine(db.sync.engine)
+# عد استعلامات كل تحديث (وضع البروفايلنج)
+if QUERY_BUDGET_MODE != "off":
+    install_query_profiler(db.sync.engine)
+
+def webhook_enabled() -> bool:
+    return bool(BASE_WEBHOOK_URL) and "YOUR_RENDER_APP_OR_REPLIT_URL_HERE" not in BASE_WEBHOOK_URL
+
+def build_bot(session: Optional[BaseSession] = None) -> Bot:
+    # session: جلسة HTTP مخصصة (مثلاً بتشاور على سيرفر Bot API محلي في اختبار الحمل)
+    bot = Bot(token=BOT_TOKEN, session=session, default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN)) # تم تغيير ParseMode إلى Markdown لدعم التنسيق
+    # زمن وأخطاء كل طلب للـ Bot API
+    bot.session.middleware(BotApiMetricsMiddleware())
+    return bot
+
+def build_dispatcher(run_background: bool = True, multiprocess: bool = False, serialize_users: bool = True) -> Dispatcher:
+    """تجهيز الديسباتشر بالراوتر وتخزين FSM وخطافات التشغيل/الإيقاف.
+
+    run_background: تشغيل شغل الخلفية (استكمال الرسائل الجماعية، outbox الجروب، لقطات الالتزام، checkpoint الـ WAL)؛
+    مع أكتر من عملية بيشتغل في عملية واحدة بس عشان مايتكررش.
+    multiprocess: لو فيه عمليات تانية بتخدم نفس البوت، الكاش المحلي بيتلغي وقاعدة البيانات هي المرجع.
+    serialize_users: قفل لكل مستخدم في الديسباتشر (polling، اللي كل تحديث فيه task لوحده)؛ الويب هوك
+    مش محتاجه لأن WebhookUpdateQueue بيرتب تحديثات كل مستخدم قبل ما توصل للديسباتشر.
+    """
+    if multiprocess:
+        db.sync.user_cache.ttl = 0
+    # حالات FSM بتتخزن في قاعدة البيانات عشان تعيش بعد الـ restart وتتشارك بين أكتر من عملية
+    storage = SQLiteStorage(
+        db,
+        state_ttl=FSM_STATE_TTL_SECONDS,
+        cache_ttl=0 if multiprocess else FSM_CACHE_TTL_SECONDS,
+        flush_interval=0 if multiprocess else FSM_FLUSH_INTERVAL_SECONDS
+    )
+    dp = Dispatcher(storage=storage)
+
+    # تحديثات نفس المستخدم بتتنفذ بالترتيب، والمستخدمين المختلفين بالتوازي
+    if serialize_users:
+        serialization = UserSerializationMiddleware()
+        dp.update.outer_middleware(serialization)
+        registry.gauge("bot_serialized_users_active", "Users with an update running or waiting.", lambda: serialization.active_users)
+
+    # زمن وأخطاء كل هاندلر (الـ inner middleware على الديسباتشر بيتطبق على كل الراوترات)
+    instrument_router(dp)
+    if QUERY_BUDGET_MODE != "off":
+        instrument_query_budget(dp, QueryBudgetMiddleware(
+            default_budget=QUERY_BUDGET_DEFAULT,
+            budgets=parse_budgets(QUERY_BUDGETS),
+            mode=QUERY_BUDGET_MODE,
+            repeat_threshold=QUERY_BUDGET_REPEAT_THRESHOLD
+        ))
+    registry.gauge("bot_user_cache", "User cache size and hit/miss counters.", db.sync.user_cache.stats, ("stat",))
 
     # تسجيل الراوتر
     dp.include_router(router)
 
-    # تهيئة قاعدة البيانات (للتأكد من إنشاء الجداول عند بدء التشغيل)
-    db = Database(DB_NAME)
+    if run_background:
+        # استكمال أي رسائل جماعية اتقطعت بسبب restart
+        async def resume_broadcasts(bot: Bot):
+            await broadcaster.resume_unfinished(bot, reply_markup=admin_menu_keyboard)
+        dp.startup.register(resume_broadcasts)
 
-    # إعداد الـ webhook إذا تم توفير BASE_WEBHOOK_URL
-    if BASE_WEBHOOK_URL and "YOUR_RENDER_APP_OR_REPLIT_URL_HERE" not in BASE_WEBHOOK_URL:
-        logging.info("Setting up webhook...")
-        app = web.Application()
-        webhook_requests_handler = SimpleRequestHandler(
-            dispatcher=dp,
-            bot=bot,
-            secret_token=WEBHOOK_SECRET,
-        )
-        webhook_requests_handler.register(app, WEBHOOK_PATH)
-        setup_webhook(app, WEBHOOK_PATH)
+        # تشغيل الـ dispatcher اللي بيبعت منشورات outbox لجروب المراجعة
+        async def start_group_outbox(bot: Bot):
+            group_outbox.start(bot)
+        dp.startup.register(start_group_outbox)
+
+        # جدولة حساب لقطات الالتزام لتقارير المشرف
+        async def start_commitment_snapshots():
+            commitment_snapshots.start()
+        dp.startup.register(start_commitment_snapshots)
+
+        # checkpoint دوري لملف الـ WAL
+        async def start_wal_checkpointer():
+            wal_checkpointer.start()
+        dp.startup.register(start_wal_checkpointer)
+
+    # إيقاف الرسائل الجماعية والـ outbox، حفظ حالات FSM المعلقة، ثم إغلاق thread pool قاعدة البيانات عند إيقاف البوت
+    async def shutdown_background():
+        await broadcaster.stop()
+        await group_outbox.stop()
+        await commitment_snapshots.stop()
+        await storage.close()
+        if run_background:
+            await wal_checkpointer.stop()
+        db.close()
+    dp.shutdown.register(shutdown_background)
+    return dp
+
+def build_webhook_app(bot: Bot, dp: Dispatcher, worker_index: int = 0) -> web.Application:
+    """تطبيق aiohttp للويب هوك و /healthz و /metrics (صيغة Prometheus).
+
+    الويب هوك بيرد على تليجرام فوراً والتحديث بيتعالج من طابور في الخلفية (WebhookUpdateQueue)،
+    بالترتيب لكل مستخدم وبالتوازي بين المستخدمين.
+    وقت الإيقاف بنستنى الطابور يخلص وبعدين نوقف الديسباتشر ونقفل جلسة البوت في on_cleanup،
+    يعني بعد ما aiohttp يقفل الطلبات المفتوحة، مش في on_shutdown (اللي بيتنفذ قبلها).
+    """
+    app = web.Application()
+    update_queue = WebhookUpdateQueue(
+        dp,
+        bot,
+        maxsize=WEBHOOK_QUEUE_SIZE,
+        workers=WEBHOOK_QUEUE_WORKERS,
+        put_timeout=WEBHOOK_QUEUE_PUT_TIMEOUT_SECONDS,
+        secret_token=WEBHOOK_SECRET,
+    )
+    update_queue.register(app, WEBHOOK_PATH)
+
+    async def healthz(request: web.Request):
+        return web.json_response({"status": "ok", "worker": worker_index, "pid": os.getpid(), "queue": update_queue.stats()})
+    app.router.add_get(HEALTHCHECK_PATH, healthz)
 
-        # Set webhook URL for the bot
+    registry.const_labels = {"worker": str(worker_index)}
+    registry.gauge(
+        "bot_update_queue", "Webhook update queue depth and counters.",
+        update_queue.stats, ("stat",)
+    )
+    app.router.add_get(METRICS_PATH, metrics_view)
+
+    async def on_startup(app: web.Application):
+        await dp.emit_startup(bot=bot, dispatcher=dp, app=app, **dp.workflow_data)
+        update_queue.start()
+
+    async def on_cleanup(app: web.Application):
+        await update_queue.stop(WEB_SHUTDOWN_TIMEOUT_SECONDS)
+        await dp.emit_shutdown(bot=bot, dispatcher=dp, app=app, **dp.workflow_data)
+        await bot.session.close()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+def run_worker(worker_index: int, workers: int):
+    """عملية ويب هوك واحدة: بتفتح المنفذ بـ SO_REUSEPORT والكيرنل بيوزع الاتصالات على العمليات."""
+    if workers > 1:
+        # جروب عمليات منفصل عشان Ctrl+C يوصل للعملية الرئيسية بس وهي اللي تبعت إشارة إيقاف واحدة
+        os.setpgrp()
+    bot = build_bot()
+    dp = build_dispatcher(run_background=worker_index == 0, multiprocess=workers > 1, serialize_users=False)
+    app = build_webhook_app(bot, dp, worker_index)
+    logging.info(f"Webhook worker {worker_index} listening on {WEB_SERVER_HOST}:{WEB_SERVER_PORT}")
+    web.run_app(
+        app,
+        host=WEB_SERVER_HOST,
+        port=WEB_SERVER_PORT,
+        reuse_port=workers > 1,
+        shutdown_timeout=WEB_SHUTDOWN_TIMEOUT_SECONDS,
+        print=None,
+    )
+
+async def set_webhook():
+    # تعيين الويب هوك مرة واحدة من العملية الرئيسية قبل تشغيل العمليات
+    bot = build_bot()
+    try:
         await bot.set_webhook(
             url=f"{BASE_WEBHOOK_URL}{WEBHOOK_PATH}",
             secret_token=WEBHOOK_SECRET,
             drop_pending_updates=True # إسقاط التحديثات المعلقة عند تعيين الويب هوك
         )
+    finally:
+        await bot.session.close()
+
+def run_webhook_server(workers: int = WEB_WORKERS):
+    if workers > 1 and WEBHOOK_PER_USER_ORDERING:
+        logging.warning(
+            "WEB_WORKERS=%s ignored: per-user update ordering needs a single webhook process "
+            "(set WEBHOOK_PER_USER_ORDERING=0 to run several)", workers
+        )
+        workers = 1
+    logging.info("Setting up webhook...")
+    asyncio.run(set_webhook())
+    logging.info(f"Webhook set to: {BASE_WEBHOOK_URL}{WEBHOOK_PATH}")
+    print(f"✅ البوت يعمل في وضع الويب هوك على المنفذ {WEB_SERVER_PORT} بعدد {workers} عملية...")
+
+    if workers <= 1:
+        run_worker(0, 1)
+        return
+
+    # spawn بدل fork عشان كل عملية تفتح اتصالات قاعدة البيانات والـ thread pool بتوعها من الأول
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_worker, args=(index, workers), name=f"webhook-worker-{index}")
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    # SIGTERM/SIGINT بيتبعت للعمليات، وكل عملية بتقفل بهدوء بعد ما تخلص التحديثات اللي شغالة
+    stopping = False
+
+    def forward_signal(signum, frame):
+        nonlocal stopping
+        if stopping:
+            return
+        stopping = True
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+    signal.signal(signal.SIGTERM, forward_signal)
+    signal.signal(signal.SIGINT, forward_signal)
+
+    for process in processes:
+        process.join()
+
+async def run_polling():
+    # تشغيل البوت في وضع الاستطلاع (polling) للتطوير المحلي أو لو لم يتم توفير BASE_WEBHOOK_URL
+    bot = build_bot()
+    dp = build_dispatcher()
+    logging.info("Starting bot in polling mode...")
+    print("✅ البوت يعمل في وضع الاستطلاع... انتظر استقبال الأوامر")
+    await dp.start_polling(bot)
 
-        logging.info(f"Webhook set to: {BASE_WEBHOOK_URL}{WEBHOOK_PATH}")
-        print(f"✅ البوت يعمل في وضع الويب هوك على المنفذ {WEB_SERVER_PORT}...")
-        web.run_app(app, host=WEB_SERVER_HOST, port=WEB_SERVER_PORT)
+def main():
+    # تطبيق aiohttp بيتبني ويشتغل بره أي event loop (web.run_app بيعمل الـ loop بتاعه)
+    if webhook_enabled():
+        run_webhook_server()
     else:
-        # تشغيل البوت في وضع الاستطلاع (polling) للتطوير المحلي أو لو لم يتم توفير BASE_WEBHOOK_URL
-        logging.info("Starting bot in polling mode...")
-        print("✅ البوت يعمل في وضع الاستطلاع... انتظر استقبال الأوامر")
-        await dp.start_polling(bot)
+        asyncio.run(run_polling())
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
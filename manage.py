@@ -0,0 +1,25 @@
+import argparse
+
+from config import DB_NAME
+from database import Database
+
+
+def rebuild_daily_stats(args):
+    db = Database(args.db)
+    rows = db.rebuild_daily_stats()
+    print(f"✅ تم إعادة بناء جدول الملخص اليومي ({rows} صف).")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="أوامر صيانة قاعدة بيانات البوت")
+    parser.add_argument("--db", default=DB_NAME, help="مسار ملف قاعدة البيانات")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("rebuild-daily-stats", help="إعادة بناء user_daily_stats من جدول الفيديوهات").set_defaults(func=rebuild_daily_stats)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
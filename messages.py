@@ -2,6 +2,7 @@
 MSG_WELCOME_NEW_USER = "👋 أهلاً بيك! من فضلك ابعتلي اسمك الأول."
 MSG_GET_NAME = "👍 تمام، دلوقتي ابعتلي اسم قناة اليوتيوب بتاعتك."
 MSG_GET_AGE = "كم عمرك؟ (الرجاء إدخال رقم صحيح)."
+MSG_GET_CHANNEL = "👍 تمام، دلوقتي ابعتلي اسم قناة اليوتيوب بتاعتك."
 MSG_INVALID_AGE = "عذراً، العمر يجب أن يكون رقماً صحيحاً. من فضلك أدخل عمرك."
 MSG_REGISTRATION_SUCCESS = "✅ تم تسجيلك بنجاح! استخدم الأزرار للتحكم في البوت."
 MSG_WELCOME_BACK = "👋 مرحباً من جديد! استخدم الأزرار للتحكم في البوت."
@@ -121,9 +122,22 @@ MSG_ADMIN_ONLY = "عذراً، هذا الأمر مخصص للمشرف فقط."
 MSG_ADMIN_MENU = "أهلاً بك أيها المشرف! اختر من القائمة:"
 
 MSG_BROADCAST_PROMPT = "تمام يا مشرف، أرسل الرسالة التي تود إرسالها لجميع المستخدمين (نص، صورة، فيديو، صوت، ملف)."
+MSG_BROADCAST_STARTED = "⏳ بدأ إرسال الرسالة رقم {job_id} لـ {total} مستخدم في الخلفية، هيوصلك تحديث بالتقدم أول بأول."
+MSG_BROADCAST_PROGRESS = "📤 جاري الإرسال... {done} من {total}"
 MSG_BROADCAST_SUCCESS = "✅ تم إرسال الرسالة إلى {count} مستخدم بنجاح."
 MSG_BROADCAST_FAILED = "⚠️ حدث خطأ أثناء إرسال الرسالة لـ {failed_count} مستخدم (ربما قاموا بحظر البوت)."
 
+MSG_BROADCAST_JOB_CRASHED = "❌ الرسالة الجماعية رقم {job_id} وقفت بسبب خطأ ({error}). هتكمل تلقائياً من مكان ما وقفت عند إعادة تشغيل البوت."
+MSG_BROADCAST_PRUNED = "🚫 تم تخطي {pruned} مستخدم غير متاح (حظروا البوت أو حذفوا حساباتهم)، واتضاف {newly_unreachable} مستخدم جديد للقائمة دي في الإرسال ده."
+
+MSG_BROADCAST_JOBS_HEADER = "📡 **آخر الرسائل الجماعية**\n"
+BROADCAST_STATUS_LABELS = {'done': "✅ اكتملت", 'running': "⏳ جاري الإرسال", 'failed': "❌ وقفت بخطأ (هتكمل مع إعادة التشغيل)"}
+MSG_BROADCAST_JOB_DETAIL = "**#{job_id}** {status}\n" \
+                           "   **التاريخ:** {created_at}\n" \
+                           "   **التقدم:** {done} من {total} (نجح {sent}، فشل {failed})\n" \
+                           "   **مستخدمين غير متاحين تم تخطيهم:** {pruned}\n"
+MSG_NO_BROADCAST_JOBS = "لا توجد رسائل جماعية حتى الآن."
+
 MSG_ALL_USERS_REPORT_HEADER = "📊 **تقرير بيانات وإحصائيات جميع المستخدمين** 📊\n\n" \
                               "عدد المستخدمين المسجلين: {total_users}\n" \
                               "إجمالي الفيديوهات القصيرة المرسلة (للكل): {total_short_videos}\n" \
@@ -139,6 +153,13 @@ MSG_USER_REPORT_DETAIL = "**{index}. الاسم:** {name}\n" \
                          "   **إجمالي فيديوهات طويلة:** {total_long}\n" \
                          "   **آخر فيديو أُرسل:** {last_video_details}\n" \
                          "   ---\n"
+MSG_ALL_USERS_REPORT_SUMMARY = "📊 **تقرير بيانات وإحصائيات جميع المستخدمين** 📊\n\n" \
+                               "عدد المستخدمين المسجلين: {total_users}\n" \
+                               "إجمالي الفيديوهات القصيرة المرسلة (للكل): {total_short_videos}\n" \
+                               "إجمالي الفيديوهات الطويلة المرسلة (للكل): {total_long_videos}\n\n" \
+                               "📎 تفاصيل كل المستخدمين في الملف المرفق."
+USERS_REPORT_COLUMNS = ("#", "الاسم", "ID", "العمر", "القناة", "النقاط الكلية", "تاريخ التسجيل",
+                        "إجمالي فيديوهات قصيرة", "إجمالي فيديوهات طويلة", "نوع آخر فيديو", "تاريخ آخر فيديو")
 MSG_NO_USERS_DATA = "لا توجد بيانات مستخدمين لعرضها في التقرير."
 
 MSG_COMMITMENT_MENU = "اختر نوع تقرير الالتزام:"
@@ -154,6 +175,16 @@ MSG_COMMITMENT_USER_DETAIL = "**{index}. الاسم:** {name} (نقاط الفت
 MSG_USER_MET_TARGET = "   **الحالة:** ملتزم ✅ (أرسل {count} فيديو قصير من أصل {required_count})"
 MSG_USER_MISSED_TARGET = "   **الحالة:** غير ملتزم ❌ (أرسل {count} فيديو قصير من أصل {required_count} مطلوب)"
 MSG_USER_NO_ACTIVITY = "   **الحالة:** لا يوجد نشاط خلال هذه الفترة 💤"
+MSG_COMMITMENT_REPORT_SUMMARY = "📈 **تقرير الالتزام {period}** 📈\n\n" \
+                                "عدد المستخدمين: {total_users}\n" \
+                                "المطلوب من الفيديوهات القصيرة: {required_count}\n" \
+                                "ملتزم ✅: {met}\n" \
+                                "غير ملتزم ❌: {missed}\n" \
+                                "لا يوجد نشاط 💤: {inactive}\n\n" \
+                                "📎 التفاصيل في الملف المرفق."
+COMMITMENT_REPORT_COLUMNS = ("#", "الاسم", "القناة", "العمر", "تاريخ التسجيل", "نقاط الفترة",
+                             "فيديوهات قصيرة", "فيديوهات طويلة", "المطلوب", "الحالة")
+COMMITMENT_STATUS_LABELS = {'met': "ملتزم", 'missed': "غير ملتزم", 'none': "لا يوجد نشاط"}
 MSG_NO_COMMITMENT_DATA_FOR_PERIOD = "لا توجد بيانات نشاط للمستخدمين خلال هذه الفترة."
 
 # تنسيق الكابشن الموحد للمجموعة (فيديوهات، مشاكل، استفسارات، موافقة)
@@ -169,3 +200,9 @@ GROUP_CAPTION_FORMAT = (
     "**تاريخ الإرسال:** {send_date}\n"
     "{additional_info}" # للمشاكل والاستفسارات
 )
+
+# تنبيه للمشرف لما تليجرام يرفض منشور للمجموعة حتى من غير تنسيق (مش هيتعاد)
+MSG_GROUP_POST_FAILED = "⚠️ حدث خطأ أثناء إرسال منشور للمجموعة ولن تتم إعادة المحاولة (منشورات رقم {post_ids}): {error}"
+
+# سطر إضافي فوق الكابشن لما أكتر من فيديو قصير يتبعتوا للمجموعة مع بعض
+GROUP_MEDIA_BATCH_HEADER = "📦 **{count} فيديوهات قصيرة في الدفعة دي**\n\n"
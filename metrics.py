@@ -0,0 +1,264 @@
+import bisect
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import TelegramObject
+from aiohttp import web
+from sqlalchemy import event
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type_name}"
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self, const_labels: Dict[str, str]) -> Iterable[str]:
+        yield from self.header()
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels({**const_labels, **dict(zip(self.labelnames, key))})} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, *args, buckets: Iterable[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # عداد لكل bucket (غير تراكمي) + المجموع + العدد
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def collect(self, const_labels: Dict[str, str]) -> Iterable[str]:
+        yield from self.header()
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        for key, (counts, total, count) in items:
+            labels = {**const_labels, **dict(zip(self.labelnames, key))}
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {count}"
+            yield f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(labels)} {count}"
+
+
+class Gauge(_Metric):
+    """قيمة لحظية بتتقرا وقت الـ scrape من دالة: بترجع رقم، أو dict من قيم الـ labels للرقم."""
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, func: Callable[[], Any], labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.func = func
+
+    def collect(self, const_labels: Dict[str, str]) -> Iterable[str]:
+        yield from self.header()
+        values = self.func()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in values.items():
+            key = key if isinstance(key, tuple) else (key,)
+            yield f"{self.name}{_format_labels({**const_labels, **dict(zip(self.labelnames, key))})} {_format_value(value)}"
+
+
+class MetricsRegistry:
+    """registry بسيط بصيغة Prometheus النصية (من غير مكتبة إضافية).
+
+    كل عملية ويب هوك ليها registry خاص بيها، فبنضيف label ``worker`` ثابت عن طريق const_labels
+    عشان Prometheus يقدر يجمع القيم من كل العمليات.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self.const_labels: Dict[str, str] = {}
+
+    def _register(self, metric: _Metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets=buckets))
+
+    def gauge(self, name: str, documentation: str, func: Callable[[], Any], labelnames: Iterable[str] = ()) -> Gauge:
+        # الـ gauge بيتسجل من جديد عشان الدالة تشاور على آخر object (مثلاً طابور العملية الحالية)
+        metric = Gauge(name, documentation, func, labelnames)
+        self._metrics[name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect(self.const_labels))
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+handler_duration = registry.histogram(
+    "bot_handler_duration_seconds", "Handler execution time.", ("event", "handler")
+)
+handler_errors = registry.counter(
+    "bot_handler_errors_total", "Handlers that raised an exception.", ("event", "handler", "error")
+)
+db_statements = registry.counter(
+    "bot_db_statements_total", "SQL statements executed.", ("operation",)
+)
+db_statement_duration = registry.histogram(
+    "bot_db_statement_duration_seconds", "SQL statement execution time.", ("operation",)
+)
+db_errors = registry.counter(
+    "bot_db_errors_total", "SQL statements that failed.", ("operation",)
+)
+bot_api_duration = registry.histogram(
+    "bot_api_request_duration_seconds", "Telegram Bot API request time.", ("method",)
+)
+bot_api_errors = registry.counter(
+    "bot_api_errors_total", "Telegram Bot API requests that failed.", ("method", "error")
+)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """inner middleware بيقيس زمن كل هاندلر (باسم الدالة) وعدد الأخطاء اللي طلعت منه."""
+
+    def __init__(self, event_name: str):
+        self.event_name = event_name
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get('handler')
+        name = getattr(getattr(handler_object, 'callback', None), '__name__', 'unknown')
+        started_at = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            handler_errors.inc(event=self.event_name, handler=name, error=type(e).__name__)
+            raise
+        finally:
+            handler_duration.observe(time.perf_counter() - started_at, event=self.event_name, handler=name)
+
+
+def instrument_router(router, event_names: Iterable[str] = ('message', 'callback_query')):
+    for event_name in event_names:
+        router.observers[event_name].middleware(HandlerMetricsMiddleware(event_name))
+
+
+class BotApiMetricsMiddleware(BaseRequestMiddleware):
+    """middleware على جلسة البوت بيقيس زمن كل طلب للـ Bot API (sendMessage, sendVideo...)."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        name = getattr(method, '__api_method__', type(method).__name__)
+        started_at = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            bot_api_errors.inc(method=name, error=type(e).__name__)
+            raise
+        finally:
+            bot_api_duration.observe(time.perf_counter() - started_at, method=name)
+
+
+def _operation(statement: str) -> str:
+    parts = statement.lstrip().split(None, 1)
+    return parts[0].upper() if parts else "UNKNOWN"
+
+
+def instrument_engine(engine):
+    """عداد وزمن لكل استعلام SQL عن طريق events بتاعة SQLAlchemy (بتشتغل في threads قاعدة البيانات)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started_at', []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started_at = conn.info['metrics_started_at'].pop()
+        operation = _operation(statement)
+        db_statements.inc(operation=operation)
+        db_statement_duration.observe(time.perf_counter() - started_at, operation=operation)
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(context):
+        started = context.connection.info.get('metrics_started_at') if context.connection is not None else None
+        if started:
+            started.pop()
+        db_errors.inc(operation=_operation(context.statement or ""))
+
+
+async def metrics_view(request: web.Request) -> web.Response:
+    return web.Response(body=registry.render().encode(), headers={"Content-Type": CONTENT_TYPE})
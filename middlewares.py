@@ -0,0 +1,55 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+
+class _UserLock:
+    __slots__ = ('lock', 'waiters')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.waiters = 0
+
+
+class UserSerializationMiddleware(BaseMiddleware):
+    """تنفيذ تحديثات نفس المستخدم بالترتيب واحد ورا التاني، وتحديثات المستخدمين المختلفين بالتوازي.
+
+    من غيره فيديوهين قصيرين ورا بعض ممكن الاتنين يقروا get_today_videos_count قبل ما أي واحد يتسجل،
+    وانتقالات FSM ممكن تتداخل. كل مستخدم ليه asyncio.Lock (بيحافظ على ترتيب الوصول) بيتمسح أول ما
+    مايبقاش فيه تحديثات شغالة أو مستنية، فعدد الأقفال على قد المستخدمين النشطين بس.
+    بيتسجل كـ outer middleware على dp.update بعد UserContextMiddleware عشان event_from_user يكون جاهز.
+
+    ده مناسب للـ polling بس، لأن كل تحديث فيه task لوحده فالانتظار على القفل مابيحجزش حاجة. في الويب هوك
+    الترتيب بيتعمل في WebhookUpdateQueue (طابور لكل مستخدم) عشان الانتظار مايحجزش مكان من أماكن التنفيذ.
+    """
+
+    def __init__(self):
+        self._locks: Dict[int, _UserLock] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get('event_from_user')
+        if user is None:
+            return await handler(event, data)
+
+        entry = self._locks.get(user.id)
+        if entry is None:
+            entry = self._locks[user.id] = _UserLock()
+        entry.waiters += 1
+        try:
+            async with entry.lock:
+                return await handler(event, data)
+        finally:
+            entry.waiters -= 1
+            if entry.waiters == 0:
+                del self._locks[user.id]
+
+    @property
+    def active_users(self) -> int:
+        return len(self._locks)
@@ -0,0 +1,168 @@
+import asyncio
+import datetime
+import logging
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramBadRequest
+from aiogram.types import InputMediaVideo
+
+import messages as msg_texts
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class GroupOutboxDispatcher:
+    """تفريغ outbox منشورات جروب المراجعة في الخلفية.
+
+    الهاندلرز بتسجل المنشور في جدول group_outbox وبترد على المستخدم فوراً، والـ dispatcher ده
+    بيبعت المنشورات بالترتيب تحت حد تليجرام للجروب (~20 رسالة/دقيقة). المنشور مابيتعلمش
+    إنه اتبعت غير بعد نجاح الإرسال (at-least-once)، والفشل بيتعاد بعد مهلة بتزيد مع كل محاولة.
+    رفض تليجرام للمنشور نفسه (TelegramBadRequest، زي Markdown بايظ) مابيتعادش: بيتجرب مرة
+    كنص عادي من غير تنسيق، ولو فشل المنشور بيتعلم failed فوراً والمشرف بيتبلغ.
+
+    الفيديوهات القصيرة المتتالية من نفس المستخدم بتستنى ``media_batch_window`` ثانية (أو لحد
+    ``media_batch_max`` فيديو) وبتتبعت مع بعض في ``send_media_group`` واحدة بكابشن مجمع.
+    """
+
+    def __init__(self, db, rate_per_minute: float = 20, max_attempts: int = 5, poll_interval: float = 5.0, batch_size: int = 20,
+                 media_batch_window: float = 10.0, media_batch_max: int = 10, admin_chat_id: Optional[int] = None):
+        self.db = db
+        self.admin_chat_id = admin_chat_id
+        self.media_batch_window = media_batch_window
+        self.media_batch_max = media_batch_max
+        self.bucket = TokenBucket(rate_per_minute, per=60, capacity=1)
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, bot: Bot):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(bot))
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def notify(self):
+        """تنبيه الـ dispatcher إن فيه منشور جديد بدل ما يستنى الـ poll الجاي."""
+        self._wakeup.set()
+
+    def video_post(self, chat_id: int, file_id: str, caption: str, batch_key: str = None) -> dict:
+        """بارامترات منشور فيديو للـ outbox (لـ enqueue_group_post أو record_submission).
+        الفيديوهات بنفس batch_key بتتجمع في media group واحدة."""
+        return {
+            'chat_id': chat_id, 'kind': 'video', 'text': caption, 'file_id': file_id,
+            'batch_key': batch_key, 'batch_window': self.media_batch_window, 'batch_max': self.media_batch_max,
+        }
+
+    async def enqueue_message(self, chat_id: int, text: str):
+        post_id = await self.db.enqueue_group_post(chat_id, 'message', text)
+        self.notify()
+        return post_id
+
+    async def _send(self, bot: Bot, posts, parse_mode: Optional[str] = 'Markdown'):
+        if len(posts) > 1:
+            # الكابشن المجمع: عدد الفيديوهات + كابشن آخر فيديو (فيه أحدث إحصائيات) على أول عنصر
+            caption = msg_texts.GROUP_MEDIA_BATCH_HEADER.format(count=len(posts)) + posts[-1].text
+            media = [
+                InputMediaVideo(media=post.file_id, caption=caption if i == 0 else None, parse_mode=parse_mode)
+                for i, post in enumerate(posts)
+            ]
+            await bot.send_media_group(chat_id=posts[0].chat_id, media=media)
+        elif posts[0].kind == 'video':
+            await bot.send_video(chat_id=posts[0].chat_id, video=posts[0].file_id, caption=posts[0].text, parse_mode=parse_mode)
+        else:
+            await bot.send_message(chat_id=posts[0].chat_id, text=posts[0].text, parse_mode=parse_mode)
+
+    def _retry_delay(self, attempts: int) -> float:
+        return min(5 * 2 ** attempts, 600)
+
+    async def _deliver(self, bot: Bot, posts):
+        post_ids = [post.id for post in posts]
+        await self.bucket.acquire()
+        try:
+            await self._send(bot, posts)
+        except TelegramRetryAfter as e:
+            logger.warning("Group flood limit hit, retrying outbox posts %s after %s seconds", post_ids, e.retry_after)
+            self.bucket.pause(e.retry_after)
+            next_attempt_at = datetime.datetime.now() + datetime.timedelta(seconds=e.retry_after)
+            await self.db.reschedule_group_posts(post_ids, next_attempt_at, str(e), count_attempt=False)
+        except TelegramBadRequest as e:
+            await self._deliver_plain(bot, posts, e)
+        except Exception as e:
+            attempts = max(post.attempts for post in posts) + 1
+            give_up = attempts >= self.max_attempts
+            logger.error("Failed to send outbox posts %s (attempt %s%s): %s", post_ids, attempts, ", giving up" if give_up else "", e)
+            next_attempt_at = datetime.datetime.now() + datetime.timedelta(seconds=self._retry_delay(attempts))
+            await self.db.reschedule_group_posts(post_ids, next_attempt_at, str(e), give_up=give_up)
+        else:
+            await self.db.mark_group_posts_sent(post_ids)
+
+    async def _deliver_plain(self, bot: Bot, posts, error: TelegramBadRequest):
+        """تليجرام رفض المنشور (غالباً Markdown بايظ)، فإعادته زي ما هو مش هتنجح: مرة واحدة كنص عادي وإلا failed."""
+        post_ids = [post.id for post in posts]
+        logger.warning("Telegram rejected outbox posts %s (%s), retrying without Markdown", post_ids, error)
+        await self.bucket.acquire()
+        try:
+            await self._send(bot, posts, parse_mode=None)
+        except TelegramRetryAfter as e:
+            self.bucket.pause(e.retry_after)
+            next_attempt_at = datetime.datetime.now() + datetime.timedelta(seconds=e.retry_after)
+            await self.db.reschedule_group_posts(post_ids, next_attempt_at, str(e), count_attempt=False)
+        except Exception as e:
+            logger.error("Giving up on outbox posts %s rejected by Telegram: %s", post_ids, e)
+            await self.db.reschedule_group_posts(post_ids, datetime.datetime.now(), str(e), give_up=True)
+            await self._notify_admin(bot, posts, e)
+        else:
+            await self.db.mark_group_posts_sent(post_ids)
+
+    async def _notify_admin(self, bot: Bot, posts, error: Exception):
+        if self.admin_chat_id is None:
+            return
+        try:
+            await bot.send_message(
+                self.admin_chat_id,
+                msg_texts.MSG_GROUP_POST_FAILED.format(post_ids=", ".join(str(post.id) for post in posts), error=error)
+            )
+        except Exception as e:
+            logger.error("Could not notify admin about failed outbox posts: %s", e)
+
+    async def drain(self, bot: Bot) -> int:
+        """إرسال كل المنشورات المستحقة حالياً. بيرجع عدد المنشورات اللي اتعالجت."""
+        handled = 0
+        while True:
+            posts = await self.db.get_due_group_posts(self.batch_size)
+            if not posts:
+                return handled
+            done_ids = set()
+            for post in posts:
+                if post.id in done_ids:
+                    continue
+                group = [post]
+                if post.batch_key:
+                    group = await self.db.get_pending_group_posts_batch(post.batch_key, self.media_batch_max) or [post]
+                await self._deliver(bot, group)
+                done_ids.update(p.id for p in group)
+                handled += len(group)
+
+    async def _run(self, bot: Bot):
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.drain(bot)
+            except Exception as e:
+                logger.error("Group outbox dispatcher error: %s", e)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
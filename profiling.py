@@ -0,0 +1,139 @@
+import contextvars
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+_current_profile: contextvars.ContextVar[Optional["QueryProfile"]] = contextvars.ContextVar("query_profile", default=None)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_statement(statement: str) -> str:
+    """شكل الاستعلام من غير القيم: الأرقام والنصوص بتبقى ? وقوائم IN بتتجمع، عشان نعرف الاستعلامات المتكررة."""
+    statement = _LITERALS.sub("?", statement)
+    statement = _IN_LISTS.sub("(?)", statement)
+    return _SPACES.sub(" ", statement).strip()
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryProfile:
+    """عدد استعلامات SQL وزمنها لتحديث واحد. بيتعدل من threads قاعدة البيانات، فعليه lock."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, duration: float):
+        with self._lock:
+            if self.closed:
+                # شغل خلفية اتعمل من الهاندلر وورث الـ contextvar، مابيتحسبش على التحديث
+                return
+            self.count += 1
+            self.duration += duration
+            self.statements[normalize_statement(statement)] += 1
+
+    def repeated(self, threshold: int):
+        with self._lock:
+            return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+
+def install_query_profiler(engine):
+    """events على الـ engine بتسجل كل استعلام في الـ QueryProfile الحالي (لو فيه)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _current_profile.get() is not None:
+            conn.info.setdefault('profile_started_at', []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = _current_profile.get()
+        started = conn.info.get('profile_started_at')
+        if profile is not None and started:
+            profile.record(statement, time.perf_counter() - started.pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(context):
+        started = context.connection.info.get('profile_started_at') if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+class QueryBudgetMiddleware(BaseMiddleware):
+    """inner middleware بيعد استعلامات كل تحديث ويقارنها بالحد المسموح للهاندلر.
+
+    - لو العدد عدى الحد (``budgets[handler]`` أو ``default_budget``) بيسجل تحذير، أو بيرفع
+      QueryBudgetExceeded لو ``mode == 'raise'`` (مفيد في الاختبارات عشان الـ regression يبان بدري).
+    - أي استعلام اتكرر ``repeat_threshold`` مرة أو أكتر بنفس الشكل (بيختلف في القيم بس) بيتسجل
+      كاحتمال N+1.
+    """
+
+    def __init__(self, default_budget: int = 20, budgets: Optional[Dict[str, int]] = None,
+                 mode: str = "log", repeat_threshold: int = 5):
+        self.default_budget = default_budget
+        self.budgets = budgets or {}
+        self.mode = mode
+        self.repeat_threshold = repeat_threshold
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get('handler')
+        name = getattr(getattr(handler_object, 'callback', None), '__name__', 'unknown')
+        profile = QueryProfile(name)
+        token = _current_profile.set(profile)
+        try:
+            result = await handler(event, data)
+        finally:
+            _current_profile.reset(token)
+            profile.closed = True
+        self.check(profile)
+        return result
+
+    def check(self, profile: QueryProfile):
+        for statement, count in profile.repeated(self.repeat_threshold):
+            logger.warning("Possible N+1 in %s: statement ran %s times: %s", profile.name, count, statement[:300])
+        budget = self.budgets.get(profile.name, self.default_budget)
+        if profile.count > budget:
+            message = (f"Handler {profile.name} ran {profile.count} SQL statements "
+                       f"({profile.duration * 1000:.1f} ms) over its budget of {budget}")
+            if self.mode == "raise":
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        else:
+            logger.debug("Handler %s ran %s SQL statements in %.1f ms", profile.name, profile.count, profile.duration * 1000)
+
+
+def parse_budgets(value: str) -> Dict[str, int]:
+    """'admin_users_stats_report=50,handle_video=8' -> dict."""
+    budgets = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, budget = item.partition("=")
+        budgets[name.strip()] = int(budget)
+    return budgets
+
+
+def instrument_query_budget(router, middleware: QueryBudgetMiddleware, event_names: Iterable[str] = ('message', 'callback_query')):
+    for event_name in event_names:
+        router.observers[event_name].middleware(middleware)
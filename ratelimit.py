@@ -0,0 +1,38 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """محدد معدل (token bucket) غير متزامن.
+
+    كل ``acquire`` بياخد توكن واحد؛ التوكنات بتتجدد بمعدل ``rate`` كل ``per`` ثانية
+    لحد أقصى ``capacity``. ``pause`` بيوقف كل المستهلكين مؤقتاً (مثلاً لما تليجرام يرجع retry_after).
+    """
+
+    def __init__(self, rate: float, per: float = 1.0, capacity: float = None):
+        self.rate = rate / per
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def pause(self, seconds: float):
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
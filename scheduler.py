@@ -0,0 +1,142 @@
+import asyncio
+import datetime
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+COMMITMENT_PERIODS = ('day', 'week', 'month')
+
+
+def commitment_period_start(period: str, today: datetime.date) -> datetime.date:
+    if period == 'day':
+        return today
+    if period == 'week':
+        return today - datetime.timedelta(days=today.weekday()) # بداية الأسبوع (الإثنين)
+    return today.replace(day=1)
+
+
+def required_shorts_for_period(period: str, today: datetime.date, required_daily: int) -> int:
+    """المطلوب من الفيديوهات القصيرة لحد النهارده في الفترة: المطلوب اليومي * عدد الأيام اللي مرت منها."""
+    if period == 'day':
+        return required_daily
+    if period == 'week':
+        return required_daily * (today.weekday() + 1)
+    return required_daily * today.day
+
+
+class CommitmentSnapshotScheduler:
+    """جدولة حساب لقطات الالتزام (اليوم/الأسبوع/الشهر) في الخلفية.
+
+    بيعيد الحساب عند بداية كل يوم جديد وكل ``interval_minutes`` دقيقة، وتقارير المشرف بتقرا
+    آخر لقطة + delta صغير للفيديوهات اللي بعدها، فزمن التقرير مابيكبرش مع حجم التاريخ.
+    """
+
+    def __init__(self, db, required_daily: int, interval_minutes: float = 15):
+        self.db = db
+        self.required_daily = required_daily
+        self.interval = datetime.timedelta(minutes=interval_minutes)
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    async def refresh(self, period: str, now: datetime.datetime = None):
+        now = now or datetime.datetime.now()
+        today = now.date()
+        await self.db.refresh_commitment_snapshot(
+            period,
+            commitment_period_start(period, today),
+            required_shorts_for_period(period, today, self.required_daily),
+            as_of=now
+        )
+
+    async def refresh_all(self):
+        async with self._lock:
+            now = datetime.datetime.now()
+            for period in COMMITMENT_PERIODS:
+                await self.refresh(period, now)
+        logger.info("Commitment snapshots refreshed as of %s", now)
+
+    async def ensure_fresh(self, period: str):
+        """آخر لقطة للفترة، ولو مش موجودة أو من يوم قديم (المطلوب اتغير) بتتحسب دلوقتي."""
+        run = await self.db.get_commitment_snapshot_run(period)
+        if run is None or run.computed_at.date() != datetime.date.today():
+            async with self._lock:
+                run = await self.db.get_commitment_snapshot_run(period)
+                if run is None or run.computed_at.date() != datetime.date.today():
+                    await self.refresh(period)
+                    run = await self.db.get_commitment_snapshot_run(period)
+        return run
+
+    def _seconds_until_next_run(self) -> float:
+        now = datetime.datetime.now()
+        next_midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time.min)
+        return max((min(next_midnight, now + self.interval) - now).total_seconds(), 1)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh_all()
+            except Exception as e:
+                logger.error("Failed to refresh commitment snapshots: %s", e)
+            await asyncio.sleep(self._seconds_until_next_run())
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class WalCheckpointer:
+    """checkpoint دوري لملف الـ WAL في الخلفية.
+
+    SQLite بيعمل checkpoint تلقائي كل ~1000 صفحة، بس لو فيه قراءة شغالة طول الوقت الملف ممكن يفضل
+    يكبر. هنا بنعمل PASSIVE checkpoint (مابيوقفش أي كتابة أو قراءة) كل ``interval_seconds``، و TRUNCATE
+    عند الإيقاف عشان ملف الـ WAL يرجع صفر.
+    """
+
+    def __init__(self, db, interval_seconds: float = 300):
+        self.db = db
+        self.interval = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    async def checkpoint(self, mode: str = 'PASSIVE'):
+        result = await self.db.checkpoint_wal(mode)
+        if result is not None:
+            busy, wal_pages, checkpointed = result
+            logger.debug("WAL checkpoint (%s): %s/%s pages, busy=%s", mode, checkpointed, wal_pages, busy)
+        return result
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.checkpoint()
+            except Exception as e:
+                logger.error("WAL checkpoint failed: %s", e)
+
+    def start(self):
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.checkpoint('TRUNCATE')
+        except Exception as e:
+            logger.error("Final WAL checkpoint failed: %s", e)
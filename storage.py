@@ -0,0 +1,147 @@
+import asyncio
+import datetime
+import json
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+logger = logging.getLogger(__name__)
+
+
+class _CachedRecord:
+    __slots__ = ('state', 'data', 'updated_at', 'loaded_at')
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any], updated_at: datetime.datetime):
+        self.state = state
+        self.data = data
+        self.updated_at = updated_at
+        self.loaded_at = time.monotonic()
+
+
+class SQLiteStorage(BaseStorage):
+    """تخزين FSM في قاعدة بيانات البوت (جدول fsm_states) بدل الذاكرة.
+
+    - كاش في الذاكرة بنظام write-back: الكتابة بتتسجل في الكاش فوراً وبتتحفظ في قاعدة البيانات
+      على دفعات كل ``flush_interval`` ثانية (وعند الإغلاق).
+    - القراءة من الكاش لو العنصر متعدل محلياً أو اتقرا من أقل من ``cache_ttl`` ثانية، غير كده
+      بتتقرا من قاعدة البيانات عشان العمليات التانية تشوف آخر حالة.
+    - أي حالة متعدلتش من ``state_ttl`` ثانية بتعتبر منتهية وبتتمسح دورياً.
+    """
+
+    def __init__(self, db, state_ttl: float = 86400, cache_ttl: float = 5.0, flush_interval: float = 0.5,
+                 purge_interval: float = 3600):
+        self.db = db
+        self.state_ttl = state_ttl
+        self.cache_ttl = cache_ttl
+        self.flush_interval = flush_interval
+        self.purge_interval = purge_interval
+        self._cache: Dict[str, _CachedRecord] = {}
+        self._dirty = set()
+        # مفاتيح اتسحبت من _dirty وبتتحفظ دلوقتي: الكاش فيها لسه هو المرجع لحد ما الـ commit يخلص
+        self._flushing = set()
+        self._flush_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ":".join(str(part) if part is not None else "" for part in (
+            key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny
+        ))
+
+    def _is_local(self, key: str) -> bool:
+        return key in self._dirty or key in self._flushing
+
+    def _is_expired(self, record: _CachedRecord) -> bool:
+        return (datetime.datetime.now() - record.updated_at).total_seconds() > self.state_ttl
+
+    async def _get_record(self, key: str) -> _CachedRecord:
+        record = self._cache.get(key)
+        if record is not None and (self._is_local(key) or time.monotonic() - record.loaded_at < self.cache_ttl):
+            if not self._is_expired(record):
+                return record
+        row = await self.db.get_fsm_record(key)
+        if row is None:
+            record = _CachedRecord(None, {}, datetime.datetime.now())
+        else:
+            state, data, updated_at = row
+            record = _CachedRecord(state, json.loads(data), updated_at)
+            if self._is_expired(record):
+                record = _CachedRecord(None, {}, datetime.datetime.now())
+        if not self._is_local(key):
+            self._cache[key] = record
+        return record
+
+    def _mark_dirty(self, key: str, record: _CachedRecord):
+        record.updated_at = datetime.datetime.now()
+        record.loaded_at = time.monotonic()
+        self._cache[key] = record
+        self._dirty.add(key)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self._key(key)
+        record = await self._get_record(storage_key)
+        record.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(storage_key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get_record(self._key(key))).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key = self._key(key)
+        record = await self._get_record(storage_key)
+        record.data = data.copy()
+        self._mark_dirty(storage_key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._get_record(self._key(key))).data.copy()
+
+    async def flush(self):
+        """حفظ كل التعديلات المعلقة في قاعدة البيانات في transaction واحد."""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            keys, self._dirty = self._dirty, set()
+            self._flushing = keys
+            records = []
+            for key in keys:
+                record = self._cache[key]
+                records.append((key, record.state, json.dumps(record.data, ensure_ascii=False), record.updated_at))
+            try:
+                await self.db.save_fsm_records(records)
+            except BaseException:
+                # نرجعهم للقائمة عشان يتحفظوا في المرة الجاية
+                self._dirty |= keys
+                raise
+            finally:
+                self._flushing = set()
+
+    async def _flush_loop(self):
+        while self._dirty:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - self._last_purge > self.purge_interval:
+                    self._last_purge = time.monotonic()
+                    await self.purge_expired()
+            except Exception as e:
+                logger.error("Failed to flush FSM storage: %s", e)
+
+    async def purge_expired(self):
+        """مسح الحالات المنتهية من قاعدة البيانات ومن الكاش."""
+        now = time.monotonic()
+        for key in [key for key, record in self._cache.items() if not self._is_local(key) and now - record.loaded_at >= self.cache_ttl]:
+            del self._cache[key]
+        older_than = datetime.datetime.now() - datetime.timedelta(seconds=self.state_ttl)
+        return await self.db.purge_expired_fsm_records(older_than)
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
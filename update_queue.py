@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import secrets
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+def update_user_id(update: dict) -> Optional[int]:
+    """صاحب التحديث (from.id للرسالة/الكولباك/...) من الـ JSON الخام، أو None لو التحديث مش من مستخدم."""
+    for key, value in update.items():
+        if key != "update_id" and isinstance(value, dict):
+            sender = value.get("from") or value.get("user")
+            if isinstance(sender, dict) and "id" in sender:
+                return sender["id"]
+    return None
+
+
+class WebhookUpdateQueue:
+    """استقبال تحديثات الويب هوك بسرعة وتنفيذها في الخلفية، بالترتيب لكل مستخدم.
+
+    الطلب بيترد عليه بـ 200 أول ما التحديث يدخل الطابور، فتليجرام مابيستناش شغل الهاندلر
+    (قاعدة البيانات، إرسال الفيديو للجروب...) ومابيعيدش إرسال التحديث.
+
+    كل مستخدم ليه طابور خاص وtask واحدة بتفرغه بالترتيب (بتتعمل مع أول تحديث وبتخلص لما طابوره
+    يفضى)، فتحديثات نفس المستخدم مابتتداخلش (FSM، عدادات اليوم)، والمستخدمين المختلفين بيشتغلوا
+    بالتوازي. ``workers`` بيحدد أقصى عدد تحديثات بتتنفذ في نفس الوقت، والـ task بتاخد مكان بس وهي
+    بتنفذ، مش وهي مستنية دورها، فدفعة تحديثات من مستخدم واحد ماتعطلش باقي المستخدمين.
+
+    ``maxsize`` حد لكل التحديثات المنتظرة في كل الطوابير؛ لو فضل مليان ``put_timeout`` ثانية بنرد
+    بـ 503 عشان تليجرام يعيد المحاولة بعدين (backpressure).
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, maxsize: int = 1000, workers: int = 16,
+                 put_timeout: float = 2.0, secret_token: Optional[str] = None):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.maxsize = maxsize
+        self.workers = workers
+        self.put_timeout = put_timeout
+        self.secret_token = secret_token
+        self._capacity = asyncio.Semaphore(maxsize)
+        self._running = asyncio.Semaphore(workers)
+        self._user_queues: Dict[object, Deque[Tuple[float, dict]]] = {}
+        self._drains: Dict[object, asyncio.Task] = {}
+        self._accepting = False
+        self.depth = 0
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.max_depth = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.secret_token and not secrets.compare_digest(
+            request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), self.secret_token
+        ):
+            return web.Response(status=401, text="Unauthorized")
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(status=400, text="Bad Request")
+        if not self._accepting:
+            return web.Response(status=503, text="Busy")
+        try:
+            await asyncio.wait_for(self._capacity.acquire(), self.put_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            logger.warning("Webhook queue is full (%s), rejecting update %s", self.depth, update.get("update_id"))
+            return web.Response(status=503, text="Busy")
+        self.received += 1
+        self._enqueue(update)
+        return web.json_response({})
+
+    def register(self, app: web.Application, path: str):
+        app.router.add_post(path, self.handle)
+
+    def _enqueue(self, update: dict):
+        # التحديثات اللي مش من مستخدم (زي poll) ملهاش ترتيب، فكل واحد ليه مفتاح خاص
+        key = update_user_id(update)
+        if key is None:
+            key = ("update", update.get("update_id"), id(update))
+        queue = self._user_queues.get(key)
+        if queue is None:
+            queue = self._user_queues[key] = deque()
+        queue.append((time.monotonic(), update))
+        self.depth += 1
+        self.max_depth = max(self.max_depth, self.depth)
+        if key not in self._drains:
+            self._drains[key] = asyncio.create_task(self._drain(key))
+
+    async def _drain(self, key):
+        queue = self._user_queues[key]
+        try:
+            while queue:
+                queued_at, update = queue[0]
+                async with self._running:
+                    queue.popleft()
+                    self.depth -= 1
+                    self.in_flight += 1
+                    try:
+                        await self.dispatcher.feed_raw_update(self.bot, update)
+                        self.processed += 1
+                    except Exception as e:
+                        self.failed += 1
+                        logger.error("Failed to process update %s (queued %.3fs): %s",
+                                     update.get("update_id"), time.monotonic() - queued_at, e)
+                    finally:
+                        self.in_flight -= 1
+                        self._capacity.release()
+        finally:
+            # لو الـ task اتلغت والطابور لسه فيه تحديثات، بتتشال من العداد (اتسابت وقت الإيقاف)
+            self.depth -= len(queue)
+            del self._user_queues[key]
+            del self._drains[key]
+
+    def start(self):
+        self._accepting = True
+
+    async def stop(self, timeout: float = 30.0):
+        """استنى لحد ما التحديثات اللي في الطوابير تخلص (بحد أقصى timeout) وبعدين وقف الباقي."""
+        self._accepting = False
+        deadline = time.monotonic() + timeout
+        while self._drains:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning("Dropping %s queued and %s in-flight updates after %.0fs shutdown timeout",
+                               self.depth, self.in_flight, timeout)
+                break
+            await asyncio.wait(list(self._drains.values()), timeout=remaining)
+        tasks = list(self._drains.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            'depth': self.depth,
+            'maxsize': self.maxsize,
+            'max_depth': self.max_depth,
+            'in_flight': self.in_flight,
+            'workers': self.workers,
+            'active_users': len(self._drains),
+            'received': self.received,
+            'processed': self.processed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+        }